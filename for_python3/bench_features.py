@@ -0,0 +1,56 @@
+import time
+import argparse
+
+from classifier import NewsClassifier
+from feature_bk2 import TitleFeature, CharNgramFeature
+
+
+def throughput(func, records, repeat):
+    """
+    :return: best records per second of func(records) over repeat runs
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(records) / best
+
+
+def bench(feature, categories, records, repeat):
+    """
+    :return: records per second of token extraction and of scoring against all categories
+    """
+
+    def extract(records):
+        for record in records:
+            feature.feature_tokens(record)
+
+    def score(records):
+        for record in records:
+            for cat in categories:
+                feature.condition_log_prob(record, cat)
+
+    return throughput(extract, records, repeat), throughput(score, records, repeat)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of the word level and character n-gram title features.')
+    parser.add_argument('train_file', help='training data csv file path')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the best one is reported')
+    args = parser.parse_args()
+
+    training_data = NewsClassifier.read_csv(args.train_file)[1:]
+    categories = sorted(set(record[6] for record in training_data))
+    features = [
+        ('title words [1]', lambda data: TitleFeature(data, smoothing_factor=0.01, word_joins=[1])),
+        ('title words [1, 2]', lambda data: TitleFeature(data, smoothing_factor=0.01, word_joins=[1, 2])),
+        ('char ngrams [3, 4, 5]', lambda data: CharNgramFeature(data, smoothing_factor=0.01, ngram_sizes=[3, 4, 5])),
+    ]
+    print('{:>22} {:>14} {:>14} {:>14}'.format('feature', 'train rec/s', 'tokens rec/s', 'score rec/s'))
+    for name, build in features:
+        train_rate = throughput(build, training_data, args.repeat)
+        feature = build(training_data)
+        extract_rate, score_rate = bench(feature, categories, training_data, args.repeat)
+        print('{:>22} {:>14.0f} {:>14.0f} {:>14.0f}'.format(name, train_rate, extract_rate, score_rate))
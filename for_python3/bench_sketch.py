@@ -0,0 +1,64 @@
+import random
+import argparse
+import tracemalloc
+from collections import Counter
+
+from classifier import NewsClassifier
+from feature_bk2 import TitleFeature, PublisherFeature, HostnameFeature
+from sketch import ApproximateCounter
+
+
+def build_classifier(training_data, bag_factory, word_joins):
+    classifier = NewsClassifier(word_joins=word_joins)
+    classifier.features['title'] = TitleFeature(training_data, smoothing_factor=0.01, word_joins=word_joins,
+                                                bag_factory=bag_factory)
+    classifier.features['publisher'] = PublisherFeature(training_data, bag_factory=bag_factory)
+    classifier.features['hostname'] = HostnameFeature(training_data, bag_factory=bag_factory)
+    classifier.categories = Counter([record[6] for record in training_data])
+    return classifier
+
+
+def traced_build(training_data, bag_factory, word_joins):
+    """
+    :return: the classifier and the bytes allocated by its features
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    classifier = build_classifier(training_data, bag_factory, word_joins)
+    allocated = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return classifier, allocated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Accuracy and memory of approximate counts against exact counts.')
+    parser.add_argument('train_file', help='training data csv file path, with categories')
+    parser.add_argument('--holdout', type=float, default=0.2, help='fraction of the records held out for evaluation')
+    parser.add_argument('--word-joins', type=int, nargs='+', default=[1])
+    parser.add_argument('--capacity', type=int, nargs='+', default=[64, 1024])
+    parser.add_argument('--width', type=int, nargs='+', default=[2048, 8192])
+    parser.add_argument('--depth', type=int, default=4)
+    args = parser.parse_args()
+
+    dataset = NewsClassifier.read_csv(args.train_file)
+    header, records = dataset[0], dataset[1:]
+    random.Random(0).shuffle(records)
+    split = int(len(records) * (1 - args.holdout))
+    training_data, holdout = records[:split], [header] + records[split:]
+
+    exact, exact_bytes = traced_build(training_data, dict, args.word_joins)
+    exact_preds = exact.predict_dataset(holdout)
+    exact_accuracy = exact.evaluate(holdout)['accuracy']
+    print('{:>28} {:>10} {:>10} {:>10} {:>12}'.format('backend', 'accuracy', 'agreement', 'KB', 'KB delta'))
+    print('{:>28} {:>10.4f} {:>10.4f} {:>10.1f} {:>12.1f}'.format('exact dict', exact_accuracy, 1.0,
+                                                                  exact_bytes / 1024.0, 0.0))
+    for capacity, width in [(capacity, width) for width in args.width for capacity in args.capacity]:
+        def bag_factory():
+            return ApproximateCounter(capacity=capacity, width=width, depth=args.depth)
+        approximate, approximate_bytes = traced_build(training_data, bag_factory, args.word_joins)
+        preds = approximate.predict_dataset(holdout)
+        agreement = sum(p[1] == e[1] for p, e in zip(preds, exact_preds)) * 1.0 / len(preds)
+        name = 'top-{} + cms {}x{}'.format(capacity, args.depth, width)
+        print('{:>28} {:>10.4f} {:>10.4f} {:>10.1f} {:>12.1f}'.format(
+            name, approximate.evaluate(holdout)['accuracy'], agreement, approximate_bytes / 1024.0,
+            (approximate_bytes - exact_bytes) / 1024.0))
@@ -1,5 +1,4 @@
-import sys
-import csv
+import argparse
 import math
 import numpy as np
 from collections import Counter
@@ -7,9 +6,16 @@ from sklearn.model_selection import train_test_split as tts
 
 from feature_bk2 import (
     TitleFeature,
+    CharNgramFeature,
     PublisherFeature,
     HostnameFeature,
 )
+from quantize import QuantizedModel
+from evaluation import evaluation_report, misclassified_rows, format_report
+from store import SQLiteVocabularyStore
+from profiling import PhaseProfiler
+import dataio
+from decay import DecayClock, DAY
 
 
 class NewsClassifier(object):
@@ -17,136 +23,298 @@ class NewsClassifier(object):
     News Article Classifier to classify new article.
     """
 
-    def __init__(self):
+    def __init__(self, smoothing_factor=0.01, word_joins=None, store_path=None, store_cache_size=100000,
+                 char_ngram_sizes=None, bag_factory=dict, half_life_days=None):
+        """
+        :param smoothing_factor: smoothing factor of the title feature
+        :param word_joins: word joins of the title feature, see TitleFeature. default to [1] if None is passed
+        :param store_path: optional sqlite file path. If given, the title vocabulary is kept on disk, see SQLiteVocabularyStore.
+        learn() erases the counts already in the file; use TitleFeature.from_store to reopen a trained store
+        :param store_cache_size: number of hot tokens cached in memory when store_path is given
+        :param char_ngram_sizes: optional list of character n-gram lengths. If given, a CharNgramFeature is also learnt
+        :param bag_factory: callable creating the per-category word count dicts of the title feature, e.g.
+        ApproximateCounter for bounded memory
+        :param half_life_days: optional half-life of the title counts and category priors. If given, older records
+        weigh less based on their timestamp, see DecayClock. Cannot be combined with char_ngram_sizes, whose
+        bucket counts are not time decayed
+        """
+        if half_life_days and char_ngram_sizes:
+            raise ValueError('half_life_days cannot be combined with char_ngram_sizes')
         self.name = 'new artical classifier'
+        self.smoothing_factor = smoothing_factor
+        self.word_joins = word_joins if word_joins else [1]
+        self.char_ngram_sizes = char_ngram_sizes
+        self.bag_factory = bag_factory
+        self.half_life_days = half_life_days
+        self.decay_clock = None
+        self.store = SQLiteVocabularyStore(store_path, cache_size=store_cache_size) if store_path else None
         self.features = {}
         self.categories = {}
+        # Phase level wall time, see PhaseProfiler. Replace with a profiling one to collect cProfile/tracemalloc stats
+        self.profiler = PhaseProfiler()
 
-    def learn(self, file_path,test_size ,seed):
+    def learn(self, file_path, test_size, seed, evaluate=False):
         """
         Learn traning data give the training data path.
+        :param file_path: csv file, glob or directory of csv shards, optionally compressed, see read_csv
+        :param evaluate: if True, score the training records afterwards and return the evaluation report
+        :return: None, or the evaluation report of the training records, see evaluate
         """
         # Create two features's feature class, namely news's title and news's publisher
         # training data, each data record is a list of article_id, title, url, publisher, hostname, timestamp, category.
-        training_data = self.read_csv(file_path)
-            
-        X_train, X_test, y_train, y_test = tts(training_data[:], np.zeros((6028,7)), test_size=test_size, random_state=seed)
-
-        #print('X_train type is ',type(X_train), len(X_train), X_train[1])
-        #print('y_train shape is ',np.shape(y_train))
-        
-        self.features['title'] = TitleFeature(X_train[1:], smoothing_factor=0.01, word_joins=[1])
-        # self.features['publisher'] = PublisherFeature(training_data)
-        # self.features['hostname'] = HostnameFeature(training_data[1:], smoothing_factor=1.0)
-
-        self.categories = Counter([record[6] for record in training_data[1:]])
-
-        # Write predict of training data to see the difference
-        training_pred = self.predict_dataset(X_train[:], print_ids=[])
-        compare = [['article_id', 'category', 'pred']]
-        diff_count = 0
-        for train, pred in zip(X_train[1:], training_pred):
-            if train[6] != pred[1]:
-                diff_count += 1
-            compare.append([train[0], train[6], pred[1]])
-        X_err = diff_count/len(training_pred)
-        #print ('Total number of difference is', diff_count, 'out of', len(training_pred), 'records','error rate of X_train is ',diff_count/len(training_pred))
-        return X_err
-        #self.write_csv('./data/diff.csv', compare)
+        with self.profiler.phase('read'):
+            training_data = self.read_csv(file_path)
+
+        with self.profiler.phase('train'):
+            X_train, X_test, y_train, y_test = tts(training_data[:], np.zeros((len(training_data),7)), test_size=test_size, random_state=seed)
+
+            #print('X_train type is ',type(X_train), len(X_train), X_train[1])
+            #print('y_train shape is ',np.shape(y_train))
+
+            self.decay_clock = DecayClock(self.half_life_days * DAY) if self.half_life_days else None
+            self.features['title'] = TitleFeature(X_train[1:], smoothing_factor=self.smoothing_factor, word_joins=self.word_joins,
+                                                  store=self.store, bag_factory=self.bag_factory,
+                                                  decay_clock=self.decay_clock)
+            if self.char_ngram_sizes:
+                self.features['char_ngram'] = CharNgramFeature(X_train[1:], smoothing_factor=self.smoothing_factor,
+                                                               ngram_sizes=self.char_ngram_sizes)
+            # self.features['publisher'] = PublisherFeature(training_data)
+            # self.features['hostname'] = HostnameFeature(training_data[1:], smoothing_factor=1.0)
+
+            if self.decay_clock is not None:
+                self.categories = self.decay_clock.counter(prune=False)
+                self._update_categories(training_data[1:])
+            else:
+                self.categories = Counter([record[6] for record in training_data[1:]])
+
+        if evaluate:
+            return self.evaluate(X_train)
+
+    def update(self, training_data):
+        """
+        Add more training records to the learnt model without a full retrain, e.g. the latest news.
+        With half_life_days, older evidence keeps fading as newer timestamps come in.
+        :param training_data: A list of training data records, without header.
+        """
+        with self.profiler.phase('train'):
+            for feature in self.features.values():
+                feature.update(training_data)
+            self._update_categories(training_data)
+
+    def _update_categories(self, training_data):
+        for record in training_data:
+            if self.decay_clock is not None:
+                self.decay_clock.advance(record[5])
+            self.categories[record[6]] += 1
+
+    def evaluate(self, test_dataset=None, file_path=None, diff_path=None):
+        """
+        Evaluate the predictions against the labelled records.
+        :param test_dataset: Should contain headers, each record having the category at index 6
+        :param file_path: csv file with headers
+        :param diff_path: if given, write the misclassified records to this csv file
+        :return: evaluation report with accuracy, confusion matrix and per-category precision/recall/f1
+        """
+        if not test_dataset:
+            with self.profiler.phase('read'):
+                test_dataset = self.read_csv(file_path)
+        pred_result = self.predict_dataset(test_dataset)
+        labels = [record[6] for record in test_dataset[1:]]
+        preds = [pred[1] for pred in pred_result]
+        # Labels never seen in training (e.g. a header row shuffled into the data) still get their own row
+        categories = list(self.categories) + sorted(set(labels) - set(self.categories))
+        report = evaluation_report(labels, preds, categories=categories)
+        if diff_path:
+            article_ids = [pred[0] for pred in pred_result]
+            with self.profiler.phase('write'):
+                self.write_csv(diff_path, [['article_id', 'category', 'pred']] + misclassified_rows(article_ids, labels, preds))
+        return report
 
     # for cat in self.categories:
     #     print 'current cat ', cat + ' having record ', self.categories[cat]
 
-    def predict(self, test_record, print_ids=None):
+    def log_posterior(self, test_record):
         """
-        Predict the category against the given testing news record using Naive Baysian
+        Returning the unnormalized log posterior of each category for the given testing news record.
         :param test_record:
-        :param print_ids: the article records id that needs printing
-        :return: the category label
+        :return: dict of category -> log probability, in the order of self.categories
         """
-        # For each possible category, compare the log probability
-        need_print = test_record[0] in print_ids if print_ids else False
-        max_log_prob = None
-        result = None
+        result = {}
+        total = sum(self.categories.values())
         for cat in self.categories:
             log_prob = 0
             # Iterates each features
             for feature in self.features.values():
-                log_prob += feature.condition_log_prob(test_record, cat, print_ids=print_ids)
-                if need_print:
-                    print ('[classifier] feature=', feature.name, 'log_prob=', log_prob)
+                log_prob += feature.condition_log_prob(test_record, cat)
             # Adding the prior
-            log_prob += math.log(self.categories[cat] * 1.0 / sum(self.categories.values()))
-            if need_print:
-                print ('[classifier] current cat=', cat, 'log_prob with prior=', log_prob, "\n")
+            log_prob += math.log(self.categories[cat] * 1.0 / total)
+            result[cat] = log_prob
+        return result
+
+    def predict(self, test_record):
+        """
+        Predict the category against the given testing news record using Naive Baysian
+        :param test_record:
+        :return: the category label
+        """
+        # For each possible category, compare the log probability
+        max_log_prob = None
+        result = None
+        for cat, log_prob in self.log_posterior(test_record).items():
             if max_log_prob is None or max_log_prob < log_prob:
                 max_log_prob = log_prob
                 result = cat
-        if need_print:
-            print ('[classifier] Article', test_record[0], 'Final max_log=', max_log_prob, 'with category=', result)
         return result
 
-    def predict_dataset(self, test_dataset=None, file_path=None, print_ids=[]):
+    def predict_dataset(self, test_dataset=None, file_path=None):
         """
         A list of test data record or given test data file path in csv format
         Each test data record in the form of [article_id, title, url, publisher, hostname, timestamp]
         :param test_dataset: Should contain headers
-        :param file_path: csv file with headers
-        :param print_ids: the article records id that needs printing
+        :param file_path: csv file with headers, or glob or directory of csv shards, optionally compressed.
+        Shards are decompressed and parsed in background threads while the previous chunks are scored
         :return: a list of predict tuples. tuple contains (article_id, category)
         """
-        test_dataset = test_dataset or self.read_csv(file_path)
+        if test_dataset:
+            chunks = [test_dataset]
+        else:
+            chunks = dataio.read_csv_chunks(file_path)
         result = []
-        for test_record in test_dataset[1:]:
-            pred = self.predict(test_record, print_ids=print_ids)
-            result.append([test_record[0], pred])
+        header_skipped = False
+        for chunk in chunks:
+            with self.profiler.phase('predict'):
+                for test_record in chunk:
+                    # Skip header
+                    if not header_skipped:
+                        header_skipped = True
+                        continue
+                    pred = self.predict(test_record)
+                    result.append([test_record[0], pred])
         return result
 
+    def explain(self, test_record, top_n=5):
+        """
+        Explain the prediction of the given testing news record.
+        Tokens are ranked per category by how much more likely they are in that category than on average
+        over all categories, i.e. their log probability minus its mean over the categories.
+        :param test_record:
+        :param top_n: number of top contributing tokens reported per feature and category
+        :return: dict with the predicted category, the per-category log prior and log posterior, and per feature
+        the per-category log probability and top (token, log_prob, relative contribution) tuples. Character n-gram
+        buckets are reported as the n-gram of the record hashed into them, see CharNgramFeature.token_labels
+        """
+        categories = list(self.categories)
+        total = sum(self.categories.values())
+        log_prior = np.array([math.log(self.categories[cat] * 1.0 / total) for cat in categories])
+        log_posterior = log_prior.copy()
+        features = {}
+        for key, feature in self.features.items():
+            tokens = feature.feature_tokens(test_record)
+            table = feature.token_log_probs(tokens, categories)
+            log_probs = table.sum(axis=0)
+            log_posterior += log_probs
+            relative = table - table.mean(axis=1, keepdims=True)
+            labels = feature.token_labels(test_record, tokens)
+            # Stable sort so that equally contributing tokens keep their title order
+            top = np.argsort(-relative, axis=0, kind='stable')[:top_n]
+            features[key] = dict(
+                (cat, {
+                    'log_prob': float(log_probs[j]),
+                    'top_tokens': [(labels[i], float(table[i, j]), float(relative[i, j])) for i in top[:, j]],
+                })
+                for j, cat in enumerate(categories))
+        return {
+            'article_id': test_record[0],
+            'category': categories[int(np.argmax(log_posterior))] if categories else None,
+            'log_prior': dict(zip(categories, log_prior.tolist())),
+            'log_posterior': dict(zip(categories, log_posterior.tolist())),
+            'features': features,
+        }
+
+    def quantize(self, dtype='int16'):
+        """
+        Export the trained feature tables as a QuantizedModel for compact batch scoring.
+        :param dtype: 'float32', or 'int16' fixed point with a per-category scale
+        :return: QuantizedModel. Raises ValueError for approximate count backends, which cannot list their tokens
+        """
+        return QuantizedModel(self, dtype=dtype)
+
     @classmethod
     def read_csv(cls, file_path):
+        """
+        :param file_path: csv file, glob or directory of csv shards. Files ending with .gz, .bz2, .xz or .zst
+        are decompressed on the fly. Only the header of the first shard is kept
+        :return: list of rows, header included
+        """
         dataset = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            csv_reader = csv.reader(f, delimiter=',')
-            # Omit the First line of titles
-            for row in csv_reader:
-                # Empty line
-                if not row:
-                    continue
-                dataset.append(row)
-        # Skip header
+        for chunk in dataio.read_csv_chunks(file_path):
+            dataset += chunk
         return dataset
 
     @classmethod
     def write_csv(cls, file_path, dataset):
-        with open(file_path, 'w', newline='', encoding='utf-8') as f: # disable the stupid newline in py3 csv
-            csv_writer = csv.writer(f, delimiter=',')
-            for row in dataset:
-                csv_writer.writerow(row)
+        """
+        Write rows to file_path, compressed if it ends with .gz, .bz2, .xz or .zst.
+        """
+        dataio.write_csv(file_path, dataset)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2 and len(sys.argv) != 3:
-        print ('Please specify the training data file path')
+    parser = argparse.ArgumentParser(description='Train the news classifier and optionally predict a test file.')
+    parser.add_argument('train_file', help='training data csv file, glob or directory of csv shards, optionally compressed')
+    parser.add_argument('test_file', nargs='?',
+                        help='test data csv file, glob or directory of csv shards, optionally compressed. '
+                             'Predictions are written next to a single test file unless --output is given')
+    parser.add_argument('--output', help='predictions csv file path, required if test_file is a glob or directory')
+    parser.add_argument('--compress-output', action='store_true',
+                        help='gzip the predictions written next to the test file, cannot be combined with --output')
+    parser.add_argument('--profile', action='store_true', help='collect cProfile stats per phase')
+    parser.add_argument('--trace-memory', action='store_true', help='trace memory allocations per phase with tracemalloc')
+    parser.add_argument('--profile-output', default='./profile',
+                        help='path prefix of the saved <prefix>_<phase>.pstats/.tracemalloc files')
+    args = parser.parse_args()
+    try:
+        dataio.expand_paths(args.train_file)
+        test_paths = dataio.expand_paths(args.test_file) if args.test_file else None
+    except IOError as e:
+        parser.error(str(e))
+    if test_paths is not None and not args.output and test_paths != [args.test_file]:
+        parser.error('--output is required when test_file is a glob or directory')
+    if args.output and args.compress_output:
+        parser.error('--compress-output only applies without --output, end the --output path with .gz instead')
 
     news_classifier = NewsClassifier()
+    news_classifier.profiler = PhaseProfiler(profile=args.profile, trace_memory=args.trace_memory)
     min_X_err = 1
     min_test_size = None
     min_X_err_seed = None
     for test_size in np.arange(0,0.3,0.05):
         for seed in range(1000):
-            X_err = news_classifier.learn(sys.argv[1],test_size, seed)
+            X_err = 1 - news_classifier.learn(args.train_file, test_size, seed, evaluate=True)['accuracy']
             if X_err < min_X_err:
                 min_X_err = X_err
                 min_test_size = test_size
                 min_X_err_seed = seed
                 print('test size is ',test_size, 'seed is ',seed)
             
-    min_X_err = news_classifier.learn(sys.argv[1],min_test_size,min_X_err_seed)
+    report = news_classifier.learn(args.train_file, min_test_size, min_X_err_seed, evaluate=True)
     print(min_X_err_seed, min_test_size, min_X_err)
+    print(format_report(report))
 
-    if len(sys.argv) == 3:
-        pred_result = news_classifier.predict_dataset(file_path=sys.argv[2])
+    if args.test_file:
+        pred_result = news_classifier.predict_dataset(file_path=args.test_file)
         pred_result = [('article_id', 'category')] + pred_result
-        test_file_split = sys.argv[2].split('.')
-        output_filepath = '.'.join(test_file_split[:-1]) + "_pred." + test_file_split[-1]
-        news_classifier.write_csv(output_filepath, pred_result)
+        if args.output:
+            output_filepath = args.output
+        else:
+            test_file_split = dataio.strip_compression_suffix(args.test_file).split('.')
+            output_filepath = '.'.join(test_file_split[:-1]) + "_pred." + test_file_split[-1]
+            if args.compress_output:
+                output_filepath += '.gz'
+        with news_classifier.profiler.phase('write'):
+            news_classifier.write_csv(output_filepath, pred_result)
+
+    if args.profile or args.trace_memory:
+        for path in news_classifier.profiler.save(args.profile_output):
+            print('[profile] saved', path)
+        print(news_classifier.profiler.summary())
@@ -0,0 +1,27 @@
+class IncrementOnlyCounter(object):
+    """
+    Base of the dict-like counters standing in for the token -> count dicts of the Feature classes.
+    Subclasses implement add(token, count) and get(token, default).
+    """
+
+    def add(self, token, count=1):
+        raise NotImplementedError()
+
+    def get(self, token, default=None):
+        raise NotImplementedError()
+
+    def __getitem__(self, token):
+        # Like Counter, unseen tokens count 0
+        return self.get(token, 0)
+
+    def __setitem__(self, token, value):
+        """
+        Only increments are supported, so that `counts[token] += 1` and `counts[token] = 0` keep working.
+        """
+        delta = value - self.get(token, 0)
+        # Tolerate the rounding of float counts read back and written again
+        if delta < -1e-9:
+            raise ValueError('{} counts can only be incremented'.format(type(self).__name__))
+        # Like a dict, assigning 0 to an unseen token adds it
+        if delta > 0 or token not in self:
+            self.add(token, max(delta, 0))
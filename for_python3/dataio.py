@@ -0,0 +1,162 @@
+import io
+import os
+import csv
+import bz2
+import glob
+import gzip
+import lzma
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# File name suffixes of the supported compressions
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+# How long a blocked producer waits before checking whether the consumer went away
+_PUT_TIMEOUT = 0.1
+
+
+def open_text(file_path, mode='r'):
+    """
+    Open a csv file in text mode, transparently (de)compressing based on the file name suffix.
+    :param file_path: file path, optionally ending with .gz, .bz2, .xz or .zst
+    :param mode: 'r' or 'w'
+    """
+    kwargs = dict(encoding='utf-8', newline='')
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, mode + 't', **kwargs)
+    if file_path.endswith('.bz2'):
+        return bz2.open(file_path, mode + 't', **kwargs)
+    if file_path.endswith('.xz'):
+        return lzma.open(file_path, mode + 't', **kwargs)
+    if file_path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('Reading or writing {} requires the zstandard package'.format(file_path))
+        raw = open(file_path, mode + 'b')
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, **kwargs)
+    return open(file_path, mode, **kwargs)
+
+
+def strip_compression_suffix(file_path):
+    for suffix in COMPRESSED_SUFFIXES:
+        if file_path.endswith(suffix):
+            return file_path[:-len(suffix)]
+    return file_path
+
+
+def expand_paths(file_path):
+    """
+    Expand a file path, a glob pattern or a directory of csv shards into a sorted list of file paths.
+    """
+    if os.path.isdir(file_path):
+        paths = [os.path.join(file_path, name) for name in os.listdir(file_path)
+                 if strip_compression_suffix(name).endswith('.csv')]
+    elif glob.has_magic(file_path):
+        paths = glob.glob(file_path)
+    else:
+        return [file_path]
+    if not paths:
+        raise IOError('No csv file found for {}'.format(file_path))
+    return sorted(paths)
+
+
+def _read_header(file_path):
+    """
+    Returning the first non empty row of a csv file, None if there is none.
+    """
+    with open_text(file_path) as f:
+        for row in csv.reader(f, delimiter=','):
+            if row:
+                return row
+    return None
+
+
+def _read_shard(file_path, chunk_size, header, out, stop):
+    """
+    Producer: parse one shard and put chunks of rows on the bounded queue out, then None.
+    :param header: the first row of the shard is skipped if equal to header, e.g. the header of the first shard.
+    None keeps every row
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        with open_text(file_path) as f:
+            chunk = []
+            header_seen = False
+            for row in csv.reader(f, delimiter=','):
+                # Empty line
+                if not row:
+                    continue
+                if not header_seen:
+                    header_seen = True
+                    if row == header:
+                        continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+    except Exception as e:
+        put(e)
+        return
+    put(None)
+
+
+def read_csv_chunks(file_path, chunk_size=5000, workers=2, max_chunks=4):
+    """
+    Read a csv file, glob or directory of (optionally compressed) csv shards as chunks of rows.
+    Shards are decompressed and parsed by `workers` producer threads ahead of the consumer, each
+    holding at most `max_chunks` parsed chunks, so memory stays bounded while reading overlaps with
+    whatever the consumer does with the previous chunks.
+    Rows keep the shard order; the header row of the first shard is kept, and the first row of every other
+    shard is skipped if it repeats that header, so headerless continuation shards keep all their rows.
+    :return: generator of lists of rows
+    """
+    paths = expand_paths(file_path)
+    header = _read_header(paths[0]) if len(paths) > 1 else None
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=max_chunks) for _ in paths]
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths))))
+    try:
+        # The executor starts shards in submission order, so the shard being consumed is always running
+        for i, (path, out) in enumerate(zip(paths, queues)):
+            executor.submit(_read_shard, path, chunk_size, header if i > 0 else None, out, stop)
+        for out in queues:
+            while True:
+                chunk = out.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def write_csv(file_path, dataset):
+    """
+    Write rows to a csv file, compressed if the file path ends with .gz, .bz2, .xz or .zst.
+    """
+    with open_text(file_path, 'w') as f:
+        csv_writer = csv.writer(f, delimiter=',')
+        for row in dataset:
+            csv_writer.writerow(row)
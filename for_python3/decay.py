@@ -0,0 +1,132 @@
+import math
+import weakref
+
+from counters import IncrementOnlyCounter
+
+
+# Milliseconds per day, the timestamp column holds epoch milliseconds
+DAY = 24 * 3600 * 1000.0
+
+
+class DecayClock(object):
+    """
+    Shared clock of the time-decayed counters of a model.
+    Counts fade with the given half-life relative to the latest timestamp seen. Instead of touching every
+    counter when time moves on, an event at time t is stored with weight 2 ** ((t - reference) / half_life),
+    and stored values are scaled back by 2 ** (-(now - reference) / half_life) when read. Once the weights
+    grow too large the counters are renormalized to a new reference time.
+    """
+
+    def __init__(self, half_life, max_exponent=64, prune_below=1e-6):
+        """
+        :param half_life: half-life of the counts, in timestamp units
+        :param max_exponent: renormalize once the weight of the latest event exceeds 2 ** max_exponent
+        :param prune_below: renormalization drops the entries whose decayed count fell below this value
+        """
+        if half_life <= 0:
+            raise ValueError('half_life must be positive, got {}'.format(half_life))
+        self.half_life = float(half_life)
+        self.max_exponent = max_exponent
+        self.prune_below = prune_below
+        self.reference = None
+        self.now = None
+        self.record_time = None
+        self.counters = weakref.WeakSet()
+
+    def advance(self, timestamp):
+        """
+        Set the time of the record being counted. Records older than the latest one are counted with their
+        already decayed weight; unparsable timestamps count as the latest time.
+        """
+        try:
+            t = float(timestamp)
+        except (TypeError, ValueError):
+            t = self.now if self.now is not None else 0.0
+        if self.reference is None:
+            self.reference = self.now = t
+        if t > self.now:
+            self.now = t
+            if (self.now - self.reference) / self.half_life > self.max_exponent:
+                self.renormalize()
+        self.record_time = t
+
+    def weight(self):
+        """
+        Stored weight of one event at the current record time.
+        """
+        return 2.0 ** ((self.record_time - self.reference) / self.half_life)
+
+    def scale(self):
+        """
+        Factor turning stored values into counts decayed to the latest time.
+        """
+        if self.now is None:
+            return 1.0
+        return 2.0 ** (-(self.now - self.reference) / self.half_life)
+
+    def renormalize(self):
+        """
+        Fold the current scale into every counter and move the reference time to the latest time.
+        """
+        scale = self.scale()
+        for counter in list(self.counters):
+            counter._rescale(scale, self.prune_below)
+        self.reference = self.now
+
+    def counter(self, prune=True):
+        """
+        Create a DecayedCounter bound to this clock, usable as a Feature bag_factory.
+        :param prune: if False, renormalization keeps the faded entries, e.g. for counters keyed by category
+        """
+        return DecayedCounter(self, prune)
+
+
+class DecayedCounter(IncrementOnlyCounter):
+    """
+    Time-decayed counter. Values read are counts decayed to the latest time of the clock; increments are
+    weighted by the time of the record being counted.
+    """
+
+    def __init__(self, clock, prune=True):
+        self.clock = clock
+        self.prune = prune
+        self._stored = {}
+        self._stored_total = 0.0
+        clock.counters.add(self)
+
+    def add(self, token, count=1):
+        weighted = count * self.clock.weight()
+        self._stored[token] = self._stored.get(token, 0.0) + weighted
+        self._stored_total += weighted
+
+    def get(self, token, default=None):
+        stored = self._stored.get(token)
+        return stored * self.clock.scale() if stored is not None else default
+
+    def __contains__(self, token):
+        return token in self._stored
+
+    def __len__(self):
+        return len(self._stored)
+
+    def __iter__(self):
+        return iter(self._stored)
+
+    def keys(self):
+        return self._stored.keys()
+
+    def values(self):
+        scale = self.clock.scale()
+        return (stored * scale for stored in self._stored.values())
+
+    def items(self):
+        scale = self.clock.scale()
+        return ((token, stored * scale) for token, stored in self._stored.items())
+
+    def total(self):
+        return self._stored_total * self.clock.scale()
+
+    def _rescale(self, scale, prune_below):
+        self._stored = dict((token, stored * scale) for token, stored in self._stored.items()
+                            if stored * scale >= prune_below or not self.prune)
+        self._stored_total = math.fsum(self._stored.values())
@@ -0,0 +1,139 @@
+import math
+from collections import Counter
+
+from feature_bk2 import TitleFeature
+
+
+class EnsembleClassifier(object):
+    """
+    Scores several trained NewsClassifier in one pass over the data.
+    The first classifier is the primary one, the others are shadow models. Each record is tokenized once
+    into the union of the n-gram orders needed by all title features.
+    """
+
+    def __init__(self, classifiers, weights=None):
+        """
+        :param classifiers: list of trained NewsClassifier, the first one being the primary model
+        :param weights: optional list of one weight per classifier. If passed, the weighted sum of the
+        log posteriors is also predicted as a combined category
+        """
+        if not classifiers:
+            raise ValueError('At least one classifier is required')
+        if weights is not None and len(weights) != len(classifiers):
+            raise ValueError('Expected {} weights, got {}'.format(len(classifiers), len(weights)))
+        self.name = 'ensemble of {} news classifiers'.format(len(classifiers))
+        self.classifiers = classifiers
+        self.weights = weights
+        # Same category order as the primary NewsClassifier.predict so that ties break the same way
+        self.categories = list(classifiers[0].categories)
+        for classifier in classifiers[1:]:
+            if set(classifier.categories) != set(self.categories):
+                raise ValueError('All classifiers must be trained on the same categories')
+        self.log_priors = []
+        for classifier in classifiers:
+            total = sum(classifier.categories.values())
+            self.log_priors.append(
+                dict((cat, math.log(classifier.categories[cat] * 1.0 / total)) for cat in self.categories))
+
+    @property
+    def columns(self):
+        """
+        Header of the rows returned by predict_dataset.
+        """
+        shadows = ['shadow_{}'.format(i) for i in range(1, len(self.classifiers))]
+        return ['article_id', 'category'] + shadows + (['combined'] if self.weights is not None else [])
+
+    def _record_tokens(self, test_record):
+        """
+        Tokenize the record once for all models.
+        :return: a list, per classifier, of the token lists of its features
+        """
+        splits = {}
+        ngrams = {}
+        tokens = []
+        for classifier in self.classifiers:
+            feature_tokens = []
+            for feature in classifier.features.values():
+                if isinstance(feature, TitleFeature):
+                    if feature.feature_idx not in splits:
+                        splits[feature.feature_idx] = feature._split_words(test_record[feature.feature_idx])
+                    word_split = splits[feature.feature_idx]
+                    result = []
+                    for i in feature.word_joins:
+                        if (feature.feature_idx, i) not in ngrams:
+                            ngrams[(feature.feature_idx, i)] = feature._join_words(word_split, i)
+                        result += ngrams[(feature.feature_idx, i)]
+                    feature_tokens.append(result)
+                else:
+                    feature_tokens.append(feature.feature_tokens(test_record))
+            tokens.append(feature_tokens)
+        return tokens
+
+    def log_posteriors(self, test_record):
+        """
+        :return: a list, per classifier, of category -> log posterior dicts
+        """
+        result = []
+        for classifier, log_prior, feature_tokens in zip(self.classifiers, self.log_priors,
+                                                         self._record_tokens(test_record)):
+            log_probs = {}
+            for cat in self.categories:
+                log_prob = 0
+                for feature, tokens in zip(classifier.features.values(), feature_tokens):
+                    log_prob += feature.tokens_log_prob(tokens, cat)
+                log_probs[cat] = log_prob + log_prior[cat]
+            result.append(log_probs)
+        return result
+
+    def _argmax(self, log_probs):
+        max_log_prob = None
+        result = None
+        for cat in self.categories:
+            if max_log_prob is None or max_log_prob < log_probs[cat]:
+                max_log_prob = log_probs[cat]
+                result = cat
+        return result
+
+    def predict(self, test_record):
+        """
+        :return: a list of the predicted category of each classifier, followed by the combined
+        category if weights are set
+        """
+        all_log_probs = self.log_posteriors(test_record)
+        result = [self._argmax(log_probs) for log_probs in all_log_probs]
+        if self.weights is not None:
+            combined = dict((cat, sum(w * log_probs[cat] for w, log_probs in zip(self.weights, all_log_probs)))
+                            for cat in self.categories)
+            result.append(self._argmax(combined))
+        return result
+
+    def predict_dataset(self, test_dataset=None, file_path=None):
+        """
+        A list of test data record or given test data file path in csv format
+        :param test_dataset: Should contain headers
+        :param file_path: csv file with headers
+        :return: a list of predict rows, laid out as self.columns
+        """
+        test_dataset = test_dataset or self.classifiers[0].read_csv(file_path)
+        result = []
+        for test_record in test_dataset[1:]:
+            result.append([test_record[0]] + self.predict(test_record))
+        return result
+
+    def disagreement_summary(self, pred_result):
+        """
+        Summarize how often each shadow (and the combined) prediction differs from the primary one.
+        :param pred_result: rows returned by predict_dataset
+        :return: dict of column name -> dict with the disagreement count, rate and (primary, other) pair counts
+        """
+        summary = {}
+        columns = self.columns
+        for idx in range(2, len(columns)):
+            pairs = Counter((row[1], row[idx]) for row in pred_result if row[1] != row[idx])
+            count = sum(pairs.values())
+            summary[columns[idx]] = {
+                'disagreements': count,
+                'rate': count * 1.0 / len(pred_result) if pred_result else 0.0,
+                'pairs': pairs,
+            }
+        return summary
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+def _category_index(categories, values):
+    """
+    Map each value onto the index of its category in categories.
+    """
+    categories = np.asarray(categories)
+    order = np.argsort(categories)
+    sorted_categories = categories[order]
+    pos = np.searchsorted(sorted_categories, values)
+    pos = np.minimum(pos, len(categories) - 1)
+    if not np.all(sorted_categories[pos] == values):
+        unknown = sorted(set(np.asarray(values)[sorted_categories[pos] != values].tolist()))
+        raise ValueError('Unknown categories {}'.format(unknown))
+    return order[pos]
+
+
+def evaluation_report(labels, preds, categories=None):
+    """
+    Compute accuracy, confusion matrix and per-category precision, recall and F1.
+    :param labels: array-like of the true categories
+    :param preds: array-like of the predicted categories, same length as labels
+    :param categories: optional ordered categories. default to the sorted union of labels and preds
+    :return: dict. confusion[i][j] counts records of categories[i] predicted as categories[j]
+    """
+    labels = np.asarray(labels)
+    preds = np.asarray(preds)
+    if labels.shape != preds.shape:
+        raise ValueError('labels and preds should have the same length, got {} and {}'.format(len(labels), len(preds)))
+    if categories is None:
+        categories = np.unique(np.concatenate([labels, preds]))
+    categories = list(categories)
+    k = len(categories)
+    y_true = _category_index(categories, labels) if len(labels) else np.zeros(0, dtype=np.intp)
+    y_pred = _category_index(categories, preds) if len(preds) else np.zeros(0, dtype=np.intp)
+
+    confusion = np.bincount(y_true * k + y_pred, minlength=k * k).reshape(k, k)
+    tp = np.diag(confusion).astype(np.float64)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return {
+        'categories': categories,
+        'total': len(labels),
+        'accuracy': tp.sum() / len(labels) if len(labels) else 0.0,
+        'confusion': confusion,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'support': support,
+    }
+
+
+def misclassified_rows(article_ids, labels, preds):
+    """
+    :return: [article_id, category, pred] rows of the records whose prediction differs from the label
+    """
+    article_ids = np.asarray(article_ids)
+    labels = np.asarray(labels)
+    preds = np.asarray(preds)
+    mask = labels != preds
+    return [list(row) for row in zip(article_ids[mask].tolist(), labels[mask].tolist(), preds[mask].tolist())]
+
+
+def format_report(report):
+    """
+    Format an evaluation_report as a plain text table.
+    """
+    lines = ['accuracy={:.4f} over {} records'.format(report['accuracy'], report['total']),
+             '{:>10} {:>10} {:>10} {:>10} {:>10}'.format('category', 'precision', 'recall', 'f1', 'support')]
+    for i, cat in enumerate(report['categories']):
+        lines.append('{:>10} {:>10.4f} {:>10.4f} {:>10.4f} {:>10d}'.format(
+            cat, report['precision'][i], report['recall'][i], report['f1'][i], report['support'][i]))
+    lines.append('confusion (rows=category, columns=pred):')
+    for i, cat in enumerate(report['categories']):
+        lines.append('{:>10} '.format(cat) + ' '.join('{:>6d}'.format(c) for c in report['confusion'][i]))
+    return '\n'.join(lines)
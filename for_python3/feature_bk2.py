@@ -1,7 +1,12 @@
 import re
 import math
+import numpy as np
 #import nltk
 
+# Multiplier of the polynomial rolling hash of character n-grams (64-bit FNV prime) and the final bit mixer
+HASH_BASE = np.uint64(1099511628211)
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+
 
 class Feature(object):
     """
@@ -19,23 +24,97 @@ class Feature(object):
         # 1022 out of 6027 diff
         
 
-    def condition_log_prob(self, test_record, category, print_ids=None):
+    def update(self, training_data):
+        """
+        Add the counts of more training data records, e.g. for streaming updates without a full retrain.
+        :param training_data: A list of training data records, without header.
+        """
+        raise NotImplementedError()
+
+    def condition_log_prob(self, test_record, category):
         """
         Returning the log conditional probability of passed test_record of current feature given certain category.
         :param test_record: news article record in the form of a list [article_id, title, url, publisher, hostname, timestamp]
         :param category: the class
-        :param print_ids: the record ids that need to print
         :return:
         """
         raise NotImplementedError()
 
+    def tokens_log_prob(self, tokens, category):
+        """
+        Returning the log conditional probability of already extracted tokens given certain category.
+        Equivalent to condition_log_prob when tokens is feature_tokens(test_record).
+        :param tokens: a list of tokens, see feature_tokens
+        :param category: the class
+        :return:
+        """
+        counts = self.category_counts(category)
+        total_count = self.category_total(category)
+        log_prob = 0
+        for token in tokens:
+            log_prob += math.log((counts.get(token, 0) + self.smoothing_factor) * 1.0 / total_count)
+        return log_prob
+
+    @staticmethod
+    def _bag_total(bag):
+        # Count backends other than dict (SQLite store, approximate counter) keep their own total
+        return bag.total() if hasattr(bag, 'total') else sum(bag.values())
+
+    def token_log_probs(self, tokens, categories):
+        """
+        Returning the log conditional probability of each token given each category.
+        :param tokens: a list of tokens, see feature_tokens
+        :param categories: ordered list of categories
+        :return: numpy array of shape (len(tokens), len(categories))
+        """
+        table = np.empty((len(tokens), len(categories)))
+        for j, category in enumerate(categories):
+            counts = self.category_counts(category)
+            total_count = self.category_total(category)
+            table[:, j] = [math.log((counts.get(token, 0) + self.smoothing_factor) * 1.0 / total_count) for token in tokens]
+        return table
+
+    def feature_tokens(self, test_record):
+        """
+        Returning the tokens of passed test_record that are looked up in the per-category counts.
+        :param test_record: news article record in the form of a list [article_id, title, url, publisher, hostname, timestamp]
+        :return: a list of tokens
+        """
+        raise NotImplementedError()
+
+    def token_labels(self, test_record, tokens):
+        """
+        Returning a readable label of each of the feature_tokens(test_record) tokens, e.g. for explanations.
+        """
+        return tokens
+
+    def tokenizer(self):
+        """
+        Returning a function test_record -> feature_tokens(test_record) that keeps none of the counts,
+        e.g. for exported models that outlive the feature.
+        """
+        raise NotImplementedError()
+
+    def category_counts(self, category):
+        """
+        Returning the token -> count dict of given category.
+        """
+        raise NotImplementedError()
+
+    def category_total(self, category):
+        """
+        Returning the smoothed denominator used by condition_log_prob for given category.
+        """
+        raise NotImplementedError()
+
 
 class TitleFeature(Feature):
     """
     Feature class representing the title attribute of the data records
     """
 
-    def __init__(self, training_data, smoothing_factor=1.0, word_joins=None):
+    def __init__(self, training_data, smoothing_factor=1.0, word_joins=None, store=None, store_batch_size=10000,
+                 bag_factory=dict, decay_clock=None):
         """
         :param training_data: A list of training data records.
         Each record is a list consisting of article_id, title, url, publisher, hostname, timestamp, category.
@@ -43,24 +122,59 @@ class TitleFeature(Feature):
         :param word_joins: list. allowed number of words to join together to form a new word. e.g. sentence is 'what the fuck'
         if word_joins is [1, 2], then formed vocabulary woulb be [what, the, fuck, what_the, the_fuck].
         default to [1] is None is passed
+        :param store: optional SQLiteVocabularyStore. If passed, the word counts are kept on disk instead of in memory.
+        The store is cleared first, see from_store to reopen the counts of a trained store
+        :param store_batch_size: number of records whose counts are buffered in memory before writing to the store
+        :param bag_factory: callable creating the per-category word count dict, e.g. an ApproximateCounter factory.
+        Ignored if store is passed
+        :param decay_clock: optional DecayClock. If passed, counts fade with the clock half-life based on the
+        timestamp of the records. Overrides bag_factory, cannot be combined with store
         """
         super(TitleFeature, self).__init__('Title', 1, smoothing_factor)
 
+        if store is not None and decay_clock is not None:
+            raise ValueError('Time decayed counts cannot be kept in a store')
         self.word_joins = word_joins if word_joins else [1]
+        self.store = store
+        self.store_batch_size = store_batch_size
+        self.decay_clock = decay_clock
+        self.bag_factory = decay_clock.counter if decay_clock is not None else bag_factory
         # Hold the word count for word in each category.
         self.category_bag_of_words = {}
         # Hold the total word count for each category.
-        self.category_count = {}
-        exclude_list = ['to','a','the','in', 'mt', 'on', 'about', 'as', 'of', 'for', 'by', 'from', 'that', 'after', 'sort', 'by', 'amid', 'and', 'behind', 'when', 'off', 'have', '&', 'mt.', 'say', "it's", 'en', 'not', 'top'] 
+        # Categories stay known however much their counts faded, see condition_log_prob
+        self.category_count = decay_clock.counter(prune=False) if decay_clock is not None else {}
+        self.exclude_list = ['to','a','the','in', 'mt', 'on', 'about', 'as', 'of', 'for', 'by', 'from', 'that', 'after', 'sort', 'by', 'amid', 'and', 'behind', 'when', 'off', 'have', '&', 'mt.', 'say', "it's", 'en', 'not', 'top'] 
         # don't exclue: with, will, out, at, says, over, than, it, may, 'no', 'is', 'almost', 'goes', 'app', 'why', 'us', 'how', 'brief', 'news', 'things', 'if', 'sees', 'this', 'set', 'tuesday', 'wednesday', 'thursday', 'monday', 'year', 'days', 'months, 'what', 'where', 'how', 'should', 'must', 'china', 'one', 'takes', 'gox', 'now', 'more', 'but', 'its', 'i'
+        if store is not None:
+            store.clear()
+        self.update(training_data)
+
+    @classmethod
+    def from_store(cls, store, smoothing_factor=1.0, word_joins=None, store_batch_size=10000):
+        """
+        Returning a TitleFeature over the counts already in store, e.g. a store trained by an earlier run,
+        without clearing it. word_joins must be the ones the store was trained with.
+        """
+        feature = cls([], smoothing_factor=smoothing_factor, word_joins=word_joins, store_batch_size=store_batch_size)
+        feature.store = store
+        feature.update([])
+        return feature
+
+    def update(self, training_data):
+        if self.store is not None:
+            self._update_store(training_data)
+            return
         for record in training_data:
+            if self.decay_clock is not None:
+                self.decay_clock.advance(record[5])
             category = record[6]
             if self.category_bag_of_words.get(category) is None:
-                self.category_bag_of_words[category] = {}
+                self.category_bag_of_words[category] = self.bag_factory()
                 self.category_count[category] = 0
             bag_of_words = self.category_bag_of_words[category]
             for word in self._permutate_words(record[1].lower()):
-                if (str(word) not in exclude_list): #and (str(word) not in self.stop_words)
+                if (str(word) not in self.exclude_list): #and (str(word) not in self.stop_words)
                     if (word not in bag_of_words):
                         bag_of_words[word] = 0
                         self.category_count[category] += 1 # dont count duplicate word in the same record, improve by 0.5%
@@ -69,28 +183,170 @@ class TitleFeature(Feature):
         # for k, bw in self.category_bag_of_words.items():
         #     print 'category ', k, ' with number of different words', len(bw)
 
-    def _permutate_words(self, sentence):
-        word_split = [w for w in re.split(r"\W", sentence.lower()) if w.strip()]
+    def _update_store(self, training_data):
+        store = self.store
+        batch_size = self.store_batch_size
+        batch = {}
+        categories = set(self.category_bag_of_words)
+        for i, record in enumerate(training_data):
+            categories.add(record[6])
+            bag_of_words = batch.setdefault(record[6], {})
+            for word in self._permutate_words(record[1].lower()):
+                if str(word) not in self.exclude_list:
+                    bag_of_words[word] = bag_of_words.get(word, 0) + 1
+            if (i + 1) % batch_size == 0:
+                for category, counts in batch.items():
+                    store.add_counts(category, counts)
+                batch = {}
+        for category, counts in batch.items():
+            store.add_counts(category, counts)
+        store.flush()
+        categories.update(store.categories())
+        for category in categories:
+            self.category_bag_of_words[category] = store.bag(category)
+            # A category's word count grows once per distinct word, see the in memory loop in update
+            self.category_count[category] = len(self.category_bag_of_words[category])
+
+    @staticmethod
+    def _split_words(sentence):
+        return [w for w in re.split(r"\W", sentence.lower()) if w.strip()]
+
+    @staticmethod
+    def _join_words(word_split, i):
+        return ['_'.join(word_split[j: j+i]) for j in range(len(word_split)-i + 1)]
+
+    @staticmethod
+    def _permutate(sentence, word_joins):
+        word_split = TitleFeature._split_words(sentence)
         result = []
-        for i in self.word_joins:
-            joined_words = ['_'.join(word_split[j: j+i]) for j in range(len(word_split)-i + 1)]
-            result += joined_words
+        for i in word_joins:
+            result += TitleFeature._join_words(word_split, i)
         return result
 
-    def condition_log_prob(self, test_record, category, print_ids=None):
-        need_print = test_record[0] in print_ids if print_ids else False
+    def _permutate_words(self, sentence):
+        return self._permutate(sentence, self.word_joins)
+
+    def feature_tokens(self, test_record):
+        return self._permutate_words(test_record[self.feature_idx].lower())
+
+    def tokenizer(self):
+        feature_idx, word_joins = self.feature_idx, list(self.word_joins)
+        return lambda test_record: TitleFeature._permutate(test_record[feature_idx].lower(), word_joins)
+
+    def category_counts(self, category):
+        return self.category_bag_of_words[category]
+
+    def category_total(self, category):
+        return len(self.category_bag_of_words[category]) * self.smoothing_factor + self.category_count[category]
+
+    def condition_log_prob(self, test_record, category):
         feature_value = test_record[self.feature_idx]
-        if category not in self.category_count.keys():
+        if category not in self.category_bag_of_words:
             raise AttributeError('Target category {} does not exist'.format(category))
         log_prob = 0
         for word in self._permutate_words(feature_value.lower()):
             word_count = self.category_bag_of_words[category].get(word, 0) + self.smoothing_factor
             total_word_count = (len(self.category_bag_of_words[category]) * self.smoothing_factor + self.category_count[category])
             log_prob += math.log(word_count * 1.0 / total_word_count)
-            if need_print:
-                print ('[title] word=', word, 'word count=', word_count, 'total word count=', total_word_count, 'log_prob=', log_prob)
-        if need_print:
-            print ('[title] value=', feature_value, 'log_prob=', log_prob)
+        return log_prob
+
+
+class CharNgramFeature(Feature):
+    """
+    Feature class representing the character n-grams of the title attribute of the data records.
+    N-grams are hashed with a polynomial rolling hash into a fixed number of buckets, without building substrings.
+    """
+
+    def __init__(self, training_data, smoothing_factor=1.0, ngram_sizes=None, num_buckets=2 ** 18):
+        """
+        :param training_data: A list of training data records.
+        Each record is a list consisting of article_id, title, url, publisher, hostname, timestamp, category.
+        :param smoothing_factor:
+        :param ngram_sizes: list. character n-gram lengths to extract, default to [3, 4, 5] if None is passed
+        :param num_buckets: number of hash buckets, i.e. the bounded vocabulary size
+        """
+        super(CharNgramFeature, self).__init__('CharNgram', 1, smoothing_factor)
+        self.ngram_sizes = sorted(ngram_sizes) if ngram_sizes else [3, 4, 5]
+        self.num_buckets = num_buckets
+        # Hold the fixed size bucket count array for each category.
+        self.category_bucket_counts = {}
+        # Hold the smoothed total count for each category.
+        self.category_total_count = {}
+        # Lazily built bucket -> count dicts of the non empty buckets, see category_counts
+        self._category_bag_of_ngrams = {}
+        self.update(training_data)
+
+    def update(self, training_data):
+        category_buckets = {}
+        for record in training_data:
+            category_buckets.setdefault(record[6], []).append(self._ngram_buckets(record[1]))
+        for category, buckets in category_buckets.items():
+            counts = np.bincount(np.concatenate(buckets), minlength=self.num_buckets).astype(np.int32)
+            if category in self.category_bucket_counts:
+                counts += self.category_bucket_counts[category]
+            self.category_bucket_counts[category] = counts
+            self.category_total_count[category] = int(counts.sum()) + np.count_nonzero(counts) * self.smoothing_factor
+            # The non empty bucket dict is rebuilt on the next category_counts call
+            self._category_bag_of_ngrams.pop(category, None)
+
+    def _ngram_buckets(self, sentence):
+        return self._hash_ngrams(sentence, self.ngram_sizes, self.num_buckets)
+
+    @staticmethod
+    def _hash_ngrams(sentence, ngram_sizes, num_buckets):
+        """
+        Returning the bucket of every character n-gram of sentence as a numpy array.
+        The hash of the windows of length n is extended to length n + 1 in place of re-hashing substrings.
+        """
+        # Begin/end of text markers so that n-grams at the title boundaries differ from inner ones
+        codes = np.frombuffer(('\x02' + sentence.lower() + '\x03').encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        hashes = np.zeros(len(codes), dtype=np.uint64)
+        result = []
+        for n in range(1, ngram_sizes[-1] + 1):
+            windows = len(codes) - n + 1
+            if windows <= 0:
+                break
+            hashes = hashes[:windows] * HASH_BASE + codes[n - 1:n - 1 + windows]
+            if n in ngram_sizes:
+                mixed = (hashes ^ np.uint64(n)) * HASH_MIX
+                result.append((mixed >> np.uint64(32)) % np.uint64(num_buckets))
+        if not result:
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate(result).astype(np.intp)
+
+    def feature_tokens(self, test_record):
+        return self._ngram_buckets(test_record[self.feature_idx]).tolist()
+
+    def token_labels(self, test_record, tokens):
+        """
+        Buckets are labelled with the n-gram of test_record hashed into them, '^' and '$' marking the title
+        boundaries. Other n-grams sharing the bucket are not shown.
+        """
+        text = '^' + test_record[self.feature_idx].lower() + '$'
+        # Same order as the buckets of _hash_ngrams: by n-gram length, then by position
+        return [text[j:j + n] for n in self.ngram_sizes for j in range(len(text) - n + 1)]
+
+    def tokenizer(self):
+        feature_idx, ngram_sizes, num_buckets = self.feature_idx, list(self.ngram_sizes), self.num_buckets
+        return lambda test_record: CharNgramFeature._hash_ngrams(test_record[feature_idx], ngram_sizes, num_buckets).tolist()
+
+    def category_counts(self, category):
+        if category not in self._category_bag_of_ngrams:
+            counts = self.category_bucket_counts[category]
+            buckets = np.flatnonzero(counts)
+            self._category_bag_of_ngrams[category] = dict(zip(buckets.tolist(), counts[buckets].tolist()))
+        return self._category_bag_of_ngrams[category]
+
+    def category_total(self, category):
+        return self.category_total_count[category]
+
+    def condition_log_prob(self, test_record, category):
+        feature_value = test_record[self.feature_idx]
+        if category not in self.category_bucket_counts:
+            raise AttributeError('Target category {} does not exist'.format(category))
+        buckets = self._ngram_buckets(feature_value)
+        counts = self.category_bucket_counts[category][buckets] + self.smoothing_factor
+        log_prob = float(np.log(counts).sum() - len(buckets) * math.log(self.category_total_count[category]))
         return log_prob
 
 
@@ -99,18 +355,27 @@ class PublisherFeature(Feature):
     Feature class representing the news publisher attribute of the data records
     """
 
-    def __init__(self, training_data, smoothing_factor=1.0):
+    def __init__(self, training_data, smoothing_factor=1.0, bag_factory=dict, decay_clock=None):
         """
         A list of training data records.
         Each record is a list consisting of article_id, title, url, publisher, hostname, timestamp, category.
         :param data:
+        :param bag_factory: callable creating the per-category count dict, e.g. an ApproximateCounter factory
+        :param decay_clock: optional DecayClock. If passed, counts fade with the clock half-life. Overrides bag_factory
         """
         super(PublisherFeature, self).__init__('Publisher', 3, smoothing_factor)
+        self.decay_clock = decay_clock
+        self.bag_factory = decay_clock.counter if decay_clock is not None else bag_factory
         self.category_bag_of_publishers = {}
+        self.update(training_data)
+
+    def update(self, training_data):
         for record in training_data:
+            if self.decay_clock is not None:
+                self.decay_clock.advance(record[5])
             category = record[6]
             if self.category_bag_of_publishers.get(category) is None:
-                self.category_bag_of_publishers[category] = {}
+                self.category_bag_of_publishers[category] = self.bag_factory()
             publishers = self.category_bag_of_publishers[category]
             publisher_name = record[3].strip().lower()
             if publisher_name not in publishers:
@@ -119,16 +384,26 @@ class PublisherFeature(Feature):
         # for k, bw in self.category_bag_of_publishers.items():
         #     print 'category ', k, ' with number of different publisher', len(bw)
 
-    def condition_log_prob(self, test_record, category, print_ids=None):
-        need_print = test_record[0] in print_ids if print_ids else False
+    def feature_tokens(self, test_record):
+        return [test_record[self.feature_idx].strip().lower()]
+
+    def tokenizer(self):
+        feature_idx = self.feature_idx
+        return lambda test_record: [test_record[feature_idx].strip().lower()]
+
+    def category_counts(self, category):
+        return self.category_bag_of_publishers[category]
+
+    def category_total(self, category):
+        return self._bag_total(self.category_bag_of_publishers[category]) + len(self.category_bag_of_publishers[category]) * self.smoothing_factor
+
+    def condition_log_prob(self, test_record, category):
         feature_value = test_record[self.feature_idx]
         if category not in self.category_bag_of_publishers:
             raise AttributeError('Target category {} does not exist'.format(category))
         category_hostname_count = self.category_bag_of_publishers[category].get(feature_value.strip().lower(), 0) + self.smoothing_factor
-        category_total_count = sum(self.category_bag_of_publishers[category].values()) + len(self.category_bag_of_publishers[category]) * self.smoothing_factor
+        category_total_count = self._bag_total(self.category_bag_of_publishers[category]) + len(self.category_bag_of_publishers[category]) * self.smoothing_factor
         log_prob = math.log(category_hostname_count * 1.0 / category_total_count)
-        if need_print:
-            print ('[publisher] value=', feature_value, 'count=', category_hostname_count, 'total=', category_total_count, 'log_prob=', log_prob)
         return log_prob
 
 
@@ -137,18 +412,27 @@ class HostnameFeature(Feature):
     Feature class representing the news hostname attribute of the data records
     """
 
-    def __init__(self, training_data, smoothing_factor=1.0):
+    def __init__(self, training_data, smoothing_factor=1.0, bag_factory=dict, decay_clock=None):
         """
         A list of training data records.
         Each record is a list consisting of article_id, title, url, publisher, hostname, timestamp, category.
         :param data:
+        :param bag_factory: callable creating the per-category count dict, e.g. an ApproximateCounter factory
+        :param decay_clock: optional DecayClock. If passed, counts fade with the clock half-life. Overrides bag_factory
         """
         super(HostnameFeature, self).__init__('Hostname', 4, smoothing_factor)
+        self.decay_clock = decay_clock
+        self.bag_factory = decay_clock.counter if decay_clock is not None else bag_factory
         self.category_bag_of_hostname = {}
+        self.update(training_data)
+
+    def update(self, training_data):
         for record in training_data:
+            if self.decay_clock is not None:
+                self.decay_clock.advance(record[5])
             category = record[6]
             if self.category_bag_of_hostname.get(category) is None:
-                self.category_bag_of_hostname[category] = {}
+                self.category_bag_of_hostname[category] = self.bag_factory()
             publishers = self.category_bag_of_hostname[category]
             publisher_name = record[4].strip().lower()
             if publisher_name not in publishers:
@@ -157,14 +441,24 @@ class HostnameFeature(Feature):
         # for k, bw in self.category_bag_of_hostname.items():
         #     print 'category ', k, ' with number of different hostname', len(bw)
 
-    def condition_log_prob(self, test_record, category, print_ids=None):
-        need_print = test_record[0] in print_ids if print_ids else False
+    def feature_tokens(self, test_record):
+        return [test_record[self.feature_idx].strip().lower()]
+
+    def tokenizer(self):
+        feature_idx = self.feature_idx
+        return lambda test_record: [test_record[feature_idx].strip().lower()]
+
+    def category_counts(self, category):
+        return self.category_bag_of_hostname[category]
+
+    def category_total(self, category):
+        return self._bag_total(self.category_bag_of_hostname[category]) + self.smoothing_factor * len(self.category_bag_of_hostname[category])
+
+    def condition_log_prob(self, test_record, category):
         feature_value = test_record[self.feature_idx]
         if category not in self.category_bag_of_hostname:
             raise AttributeError('Target category {} does not exist'.format(category))
         category_hostname_count = self.category_bag_of_hostname[category].get(feature_value.strip().lower(), 0) + self.smoothing_factor
-        category_total_count = sum(self.category_bag_of_hostname[category].values()) + self.smoothing_factor * len(self.category_bag_of_hostname[category])
+        category_total_count = self._bag_total(self.category_bag_of_hostname[category]) + self.smoothing_factor * len(self.category_bag_of_hostname[category])
         log_prob = math.log(category_hostname_count * 1.0 / category_total_count)
-        if need_print:
-            print ('[hostname] value=', feature_value, 'count=', category_hostname_count, 'total=', category_total_count, 'log_prob=', log_prob)
         return log_prob
@@ -0,0 +1,94 @@
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+
+class PhaseProfiler(object):
+    """
+    Collects wall time, and optionally cProfile stats and tracemalloc memory, per named phase
+    (e.g. read, train, predict, write). Repeated entries into a phase accumulate.
+    Phases do not nest: a phase entered while another one is running is accounted to the outer phase.
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        """
+        :param profile: collect cProfile stats per phase
+        :param trace_memory: trace allocations per phase with tracemalloc
+        """
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.wall_time = {}
+        self.calls = {}
+        self.profilers = {}
+        # phase -> (net allocated bytes, peak traced bytes)
+        self.memory = {}
+        self.snapshots = {}
+        self._current = None
+
+    @contextmanager
+    def phase(self, name):
+        if self._current is not None:
+            yield
+            return
+        self._current = name
+        if name not in self.wall_time:
+            self.phases.append(name)
+            self.wall_time[name] = 0.0
+            self.calls[name] = 0
+            self.memory[name] = (0, 0)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        if self.profile:
+            profiler = self.profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall_time[name] += time.perf_counter() - start
+            self.calls[name] += 1
+            if self.profile:
+                profiler.disable()
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                allocated, max_peak = self.memory[name]
+                self.memory[name] = (allocated + current - start_memory, max(max_peak, peak))
+                self.snapshots[name] = tracemalloc.take_snapshot()
+            self._current = None
+
+    def save(self, prefix):
+        """
+        Write <prefix>_<phase>.pstats cProfile stats, readable by pstats, snakeviz or flameprof,
+        and <prefix>_<phase>.tracemalloc snapshots, readable by tracemalloc.Snapshot.load.
+        :return: the list of written file paths
+        """
+        paths = []
+        for name in self.phases:
+            if name in self.profilers:
+                path = '{}_{}.pstats'.format(prefix, name)
+                self.profilers[name].dump_stats(path)
+                paths.append(path)
+            if name in self.snapshots:
+                path = '{}_{}.tracemalloc'.format(prefix, name)
+                self.snapshots[name].dump(path)
+                paths.append(path)
+        return paths
+
+    def summary(self):
+        """
+        Format the phase level wall time and memory as a plain text table.
+        """
+        lines = ['{:>10} {:>8} {:>12}'.format('phase', 'calls', 'wall (s)') +
+                 (' {:>14} {:>14}'.format('net alloc (KB)', 'peak (KB)') if self.trace_memory else '')]
+        for name in self.phases:
+            line = '{:>10} {:>8d} {:>12.4f}'.format(name, self.calls[name], self.wall_time[name])
+            if self.trace_memory:
+                allocated, peak = self.memory[name]
+                line += ' {:>14.1f} {:>14.1f}'.format(allocated / 1024.0, peak / 1024.0)
+            lines.append(line)
+        return '\n'.join(lines)
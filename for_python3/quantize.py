@@ -0,0 +1,170 @@
+import math
+import hashlib
+import numpy as np
+
+
+# Supported quantized dtypes of the exported log probability tables.
+QUANTIZED_DTYPES = ('float32', 'int16')
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def _token_key(token):
+    """
+    Stable 64-bit hash of a token, the row lookup key of the tables.
+    """
+    return int.from_bytes(hashlib.blake2b(str(token).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class QuantizedTable(object):
+    """
+    Dense token x category log probability table of one trained feature.
+    The last row holds the log probability of a token unseen in the category.
+    Rows are looked up by the sorted 64-bit hashes of the tokens; neither the tokens nor the feature counts are kept.
+    """
+
+    def __init__(self, feature, categories, dtype='int16'):
+        """
+        :param feature: a trained Feature, e.g. TitleFeature, PublisherFeature or HostnameFeature
+        :param categories: ordered list of category labels, one table column per category
+        :param dtype: 'float32', or 'int16' fixed point with a per-category scale
+        """
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError('dtype must be one of {}, got {}'.format(QUANTIZED_DTYPES, dtype))
+        self.name = feature.name
+        self.tokenize = feature.tokenizer()
+        self.dtype = dtype
+
+        vocab = set()
+        for cat in categories:
+            counts = feature.category_counts(cat)
+            # The table rows are the enumerated tokens, any other token would silently score as unseen
+            if not getattr(counts, 'enumerable', True):
+                raise ValueError('{} counts of category {} cannot enumerate their tokens, e.g. approximate counts, '
+                                 'and cannot be quantized'.format(feature.name, cat))
+            vocab.update(counts)
+        vocab = list(vocab)
+        keys = np.fromiter((_token_key(token) for token in vocab), dtype=np.uint64, count=len(vocab))
+        order = np.argsort(keys)
+        # Sorted token keys, the i-th key is the i-th row of the table
+        self.keys = keys[order]
+        if np.any(self.keys[1:] == self.keys[:-1]):
+            raise ValueError('{} tokens have colliding hashes'.format(feature.name))
+        rows = dict((vocab[i], row) for row, i in enumerate(order.tolist()))
+        self.unseen_row = len(self.keys)
+
+        table = np.empty((len(self.keys) + 1, len(categories)), dtype=np.float64)
+        for j, cat in enumerate(categories):
+            counts = feature.category_counts(cat)
+            total = feature.category_total(cat)
+            table[self.unseen_row, j] = math.log(feature.smoothing_factor * 1.0 / total)
+            column = table[:, j]
+            column[:self.unseen_row] = column[self.unseen_row]
+            for token, count in counts.items():
+                column[rows[token]] = math.log((count + feature.smoothing_factor) * 1.0 / total)
+
+        if dtype == 'float32':
+            self.scale = None
+            self.table = table.astype(np.float32)
+        else:
+            # One scale per category so that the largest magnitude maps onto the int16 range
+            max_abs = np.abs(table).max(axis=0)
+            self.scale = np.where(max_abs > 0, max_abs / INT16_MAX, 1.0)
+            self.table = np.round(table / self.scale).astype(np.int16)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + self.keys.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def token_rows(self, tokens):
+        """
+        Returning the table row of each token, the unseen row for tokens not in the table.
+        """
+        keys = np.fromiter((_token_key(token) for token in tokens), dtype=np.uint64, count=len(tokens))
+        rows = np.searchsorted(self.keys, keys)
+        found = rows < len(self.keys)
+        found[found] = self.keys[rows[found]] == keys[found]
+        return np.where(found, rows, self.unseen_row)
+
+    def score_dataset(self, test_records):
+        """
+        Returning the (n_records, n_categories) feature log probabilities of the records.
+        """
+        tokens = []
+        owners = []
+        for i, test_record in enumerate(test_records):
+            record_tokens = self.tokenize(test_record)
+            tokens += record_tokens
+            owners += [i] * len(record_tokens)
+        rows = self.token_rows(tokens)
+        scores = np.zeros((len(test_records), self.table.shape[1]), dtype=np.float64)
+        if self.scale is None:
+            np.add.at(scores, np.asarray(owners, dtype=np.intp), self.table[rows])
+        else:
+            # Accumulate the fixed point values exactly, then rescale once per category
+            fixed = np.zeros(scores.shape, dtype=np.int64)
+            np.add.at(fixed, np.asarray(owners, dtype=np.intp), self.table[rows])
+            scores = fixed * self.scale
+        return scores
+
+
+class QuantizedModel(object):
+    """
+    Quantized export of a trained NewsClassifier.
+    Scoring runs on the quantized per-feature tables instead of the nested count dicts.
+    """
+
+    def __init__(self, classifier, dtype='int16'):
+        """
+        :param classifier: a trained NewsClassifier
+        :param dtype: 'float32', or 'int16' fixed point with a per-category scale
+        """
+        self.dtype = dtype
+        # Same category order as NewsClassifier.predict so that argmax ties break the same way
+        self.categories = list(classifier.categories)
+        total = sum(classifier.categories.values())
+        self.log_prior = np.array([math.log(classifier.categories[cat] * 1.0 / total) for cat in self.categories])
+        self.tables = [QuantizedTable(feature, self.categories, dtype) for feature in classifier.features.values()]
+
+    @property
+    def nbytes(self):
+        return self.log_prior.nbytes + sum(table.nbytes for table in self.tables)
+
+    def log_posteriors(self, test_records):
+        """
+        Returning the (n_records, n_categories) unnormalized log posteriors, columns ordered as self.categories.
+        """
+        scores = np.tile(self.log_prior, (len(test_records), 1))
+        for table in self.tables:
+            scores += table.score_dataset(test_records)
+        return scores
+
+    def predict(self, test_record):
+        return self.categories[int(np.argmax(self.log_posteriors([test_record])[0]))]
+
+    def predict_dataset(self, test_dataset):
+        """
+        :param test_dataset: a list of test data records, should contain headers
+        :return: a list of predict tuples. tuple contains (article_id, category)
+        """
+        test_records = test_dataset[1:]
+        if not test_records:
+            return []
+        best = np.argmax(self.log_posteriors(test_records), axis=1)
+        return [[test_record[0], self.categories[i]] for test_record, i in zip(test_records, best)]
+
+    def disagreement(self, classifier, test_dataset):
+        """
+        Comparing the quantized predictions against the full precision predictions of classifier.
+        :param classifier: the NewsClassifier this model was exported from
+        :param test_dataset: a list of test data records, should contain headers
+        :return: dict with the number, rate and article ids of records whose argmax differs
+        """
+        full = classifier.predict_dataset(test_dataset)
+        quantized = self.predict_dataset(test_dataset)
+        article_ids = [f[0] for f, q in zip(full, quantized) if f[1] != q[1]]
+        return {
+            'total': len(full),
+            'disagreements': len(article_ids),
+            'rate': len(article_ids) * 1.0 / len(full) if full else 0.0,
+            'article_ids': article_ids,
+        }
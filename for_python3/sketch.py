@@ -0,0 +1,144 @@
+import sys
+import heapq
+import hashlib
+import numpy as np
+
+from counters import IncrementOnlyCounter
+
+
+def _token_hashes(token):
+    """
+    Two independent 64-bit hashes of the token, stable across processes unlike hash().
+    """
+    digest = hashlib.blake2b(str(token).encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class CountMinSketch(object):
+    """
+    Fixed size approximate counter. Estimates never undercount, and overcount by at most
+    e * total / width with probability 1 - exp(-depth).
+    Uses conservative update: only the cells at the current minimum are raised, which keeps the long tail
+    estimates much tighter than incrementing every row.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int32)
+        self._rows = np.arange(depth)
+
+    def _columns(self, token):
+        # Double hashing: the i-th row uses h1 + i * h2
+        h1, h2 = _token_hashes(token)
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, token, count=1):
+        cells = (self._rows, self._columns(token))
+        self.table[cells] = np.maximum(self.table[cells], self.table[cells].min() + count)
+
+    def query(self, token):
+        return int(self.table[self._rows, self._columns(token)].min())
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+
+class ApproximateCounter(IncrementOnlyCounter):
+    """
+    Bounded memory counter.
+    The `capacity` most frequent tokens are kept in a dict of exact counters (top-K: a token evicts the
+    smallest one once its sketch estimate exceeds it, and is then counted on from that estimate); every
+    token is also added to a count-min sketch which answers for the long tail.
+    The number of distinct tokens is estimated with linear counting over a fixed size bitmap.
+    """
+
+    # items()/keys() only list the heavy hitters, not every counted token, see QuantizedTable
+    enumerable = False
+
+    def __init__(self, capacity=1024, width=8192, depth=4, distinct_bits=2 ** 14):
+        """
+        :param capacity: number of heavy hitter tokens counted exactly
+        :param width: count-min sketch width
+        :param depth: count-min sketch depth
+        :param distinct_bits: size of the linear counting bitmap used by len()
+        """
+        self.capacity = capacity
+        self.heavy = {}
+        # Lazy min-heap of (count, token) over the heavy hitters, entries may be stale
+        self._heap = []
+        self.sketch = CountMinSketch(width, depth)
+        self.distinct = np.zeros(distinct_bits, dtype=bool)
+        self._total = 0
+
+    def add(self, token, count=1):
+        self._total += count
+        self.sketch.add(token, count)
+        self.distinct[_token_hashes(token)[0] % len(self.distinct)] = True
+        if token in self.heavy:
+            self.heavy[token] += count
+            return
+        if len(self.heavy) < self.capacity:
+            self.heavy[token] = count
+            heapq.heappush(self._heap, (count, token))
+            return
+        estimate = self.sketch.query(token)
+        min_count, min_token = self._min()
+        if estimate > min_count:
+            # The evicted token keeps being answered by the sketch, which already holds its counts
+            heapq.heappop(self._heap)
+            del self.heavy[min_token]
+            self.heavy[token] = estimate
+            heapq.heappush(self._heap, (estimate, token))
+
+    def _min(self):
+        # Every heavy hitter has exactly one heap entry, stale only if the token was incremented since
+        while True:
+            count, token = self._heap[0]
+            if self.heavy[token] == count:
+                return count, token
+            heapq.heapreplace(self._heap, (self.heavy[token], token))
+
+    def get(self, token, default=None):
+        if token in self.heavy:
+            return self.heavy[token]
+        estimate = self.sketch.query(token)
+        return estimate if estimate > 0 else default
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __len__(self):
+        # Linear counting estimate of the number of distinct tokens
+        zeros = len(self.distinct) - int(np.count_nonzero(self.distinct))
+        if zeros == 0:
+            return len(self.distinct)
+        return int(round(-len(self.distinct) * np.log(zeros * 1.0 / len(self.distinct))))
+
+    def total(self):
+        return self._total
+
+    def items(self):
+        """
+        Only the exactly counted heavy hitters can be enumerated.
+        """
+        return self.heavy.items()
+
+    def __iter__(self):
+        return iter(self.heavy)
+
+    def keys(self):
+        return self.heavy.keys()
+
+    def values(self):
+        return self.heavy.values()
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory of the counter: sketch and bitmap arrays plus the heavy hitter dict and heap.
+        """
+        heavy = sys.getsizeof(self.heavy) + sys.getsizeof(self._heap) + \
+            sum(sys.getsizeof(token) + sys.getsizeof(count) for token, count in self.heavy.items())
+        return self.sketch.nbytes + self.distinct.nbytes + heavy
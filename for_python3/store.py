@@ -0,0 +1,117 @@
+import sqlite3
+from collections import OrderedDict
+
+
+class SQLiteVocabularyStore(object):
+    """
+    On-disk token -> per-category count store backed by SQLite, for vocabularies that do not fit in memory.
+    Looked up tokens are kept in a small LRU cache holding the counts of all categories of the token.
+    """
+
+    def __init__(self, path, cache_size=100000):
+        """
+        :param path: sqlite database file path. ':memory:' keeps the store in memory, mostly for testing
+        :param cache_size: maximum number of tokens kept in the hot token cache
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS counts ('
+            'token TEXT NOT NULL, category TEXT NOT NULL, count INTEGER NOT NULL, '
+            'PRIMARY KEY (token, category)) WITHOUT ROWID')
+        self.connection.commit()
+        self._cache = OrderedDict()
+        self._stats = None
+
+    def clear(self):
+        self.connection.execute('DELETE FROM counts')
+        self.connection.commit()
+        self._cache.clear()
+        self._stats = None
+
+    def add_counts(self, category, counts):
+        """
+        Add the token -> count dict to the stored counts of category.
+        """
+        self.connection.executemany(
+            'INSERT INTO counts (token, category, count) VALUES (?, ?, ?) '
+            'ON CONFLICT (token, category) DO UPDATE SET count = count + excluded.count',
+            ((token, category, count) for token, count in counts.items()))
+        self._cache.clear()
+        self._stats = None
+
+    def flush(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def _category_stats(self):
+        # category -> (number of distinct tokens, total count)
+        if self._stats is None:
+            rows = self.connection.execute('SELECT category, COUNT(*), SUM(count) FROM counts GROUP BY category')
+            self._stats = dict((category, (distinct, total)) for category, distinct, total in rows)
+        return self._stats
+
+    def categories(self):
+        return list(self._category_stats())
+
+    def token_counts(self, token):
+        """
+        Returning the category -> count dict of token, through the hot token cache.
+        """
+        counts = self._cache.get(token)
+        if counts is not None:
+            self._cache.move_to_end(token)
+            return counts
+        counts = dict(self.connection.execute('SELECT category, count FROM counts WHERE token = ?', (token,)))
+        self._cache[token] = counts
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return counts
+
+    def bag(self, category):
+        return CategoryBag(self, category)
+
+
+class CategoryBag(object):
+    """
+    Read-only dict-like view of the token counts of one category of a SQLiteVocabularyStore.
+    Stands in for the per-category dicts of the Feature classes.
+    """
+
+    def __init__(self, store, category):
+        self.store = store
+        self.category = category
+
+    def get(self, token, default=None):
+        return self.store.token_counts(token).get(self.category, default)
+
+    def __getitem__(self, token):
+        count = self.get(token)
+        if count is None:
+            raise KeyError(token)
+        return count
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __len__(self):
+        return self.store._category_stats().get(self.category, (0, 0))[0]
+
+    def total(self):
+        return self.store._category_stats().get(self.category, (0, 0))[1]
+
+    def items(self):
+        return iter(self.store.connection.execute(
+            'SELECT token, count FROM counts WHERE category = ?', (self.category,)))
+
+    def __iter__(self):
+        return (token for token, _ in self.items())
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (count for _, count in self.items())
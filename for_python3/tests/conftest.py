@@ -0,0 +1,23 @@
+import pytest
+
+from helpers import GOLDEN_FILE, TEST_FILE, NewsClassifier, reference_classifier
+
+
+@pytest.fixture(scope='session')
+def classifier():
+    return reference_classifier()
+
+
+@pytest.fixture(scope='session')
+def test_dataset():
+    return NewsClassifier.read_csv(TEST_FILE)
+
+
+@pytest.fixture(scope='session')
+def golden():
+    """
+    :return: (categories, list of (article_id, category, [log posterior per category]))
+    """
+    rows = NewsClassifier.read_csv(GOLDEN_FILE)
+    categories = [column[len('log_posterior_'):] for column in rows[0][2:]]
+    return categories, [(row[0], row[1], [float(v) for v in row[2:]]) for row in rows[1:]]
@@ -0,0 +1,43 @@
+"""
+Shared test data and builders, imported by the test modules and by make_golden.py.
+"""
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from classifier import NewsClassifier  # noqa: E402
+
+DATA_DIR = os.path.join(TESTS_DIR, '..', '..', 'data')
+TRAIN_FILE = os.path.join(DATA_DIR, 'train_v2.csv')
+TEST_FILE = os.path.join(DATA_DIR, 'test_v2.csv')
+GOLDEN_FILE = os.path.join(TESTS_DIR, 'golden', 'test_v2_reference.csv')
+# learn() arguments the golden output was frozen with
+REFERENCE_TEST_SIZE = 0.05
+REFERENCE_SEED = 0
+# Columns of the synthetic records
+HEADER = ['article_id', 'title', 'url', 'publisher', 'hostname', 'timestamp', 'category']
+
+
+def synthetic_dataset(rng, n_records, categories):
+    """
+    Titles drawn from a per-category skewed vocabulary, so that categories are partly separable.
+    """
+    vocabulary = ['w{}'.format(i) for i in range(rng.randint(20, 200))]
+    publishers = ['Publisher {}'.format(i) for i in range(rng.randint(2, 15))]
+    dataset = [HEADER]
+    for i in range(n_records):
+        category = rng.choice(categories)
+        offset = categories.index(category) * 7
+        words = [vocabulary[(offset + int(rng.expovariate(0.2))) % len(vocabulary)] for _ in range(rng.randint(0, 12))]
+        publisher = publishers[(offset + rng.randint(0, 3)) % len(publishers)]
+        hostname = 'www.{}.com'.format(publisher.split()[-1])
+        dataset.append([str(i), ' '.join(words), 'http://' + hostname, publisher, hostname, '1.39E+12', category])
+    return dataset
+
+
+def reference_classifier(**kwargs):
+    classifier = NewsClassifier(**kwargs)
+    classifier.learn(TRAIN_FILE, REFERENCE_TEST_SIZE, REFERENCE_SEED)
+    return classifier
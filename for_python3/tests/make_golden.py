@@ -0,0 +1,16 @@
+"""
+Regenerate golden/test_v2_reference.csv from the current NewsClassifier.predict implementation.
+Only rerun when a change to the reference predictions is intended.
+"""
+from helpers import GOLDEN_FILE, TEST_FILE, NewsClassifier, reference_classifier
+
+
+if __name__ == '__main__':
+    classifier = reference_classifier()
+    categories = list(classifier.categories)
+    rows = [['article_id', 'category'] + ['log_posterior_' + cat for cat in categories]]
+    for test_record in NewsClassifier.read_csv(TEST_FILE)[1:]:
+        log_posterior = classifier.log_posterior(test_record)
+        rows.append([test_record[0], classifier.predict(test_record)] + [repr(log_posterior[cat]) for cat in categories])
+    NewsClassifier.write_csv(GOLDEN_FILE, rows)
+    print('Wrote', len(rows) - 1, 'reference rows to', GOLDEN_FILE)
@@ -0,0 +1,130 @@
+import random
+from collections import Counter
+
+import pytest
+
+from classifier import NewsClassifier
+from decay import DecayClock, DAY
+from feature_bk2 import TitleFeature, PublisherFeature, CharNgramFeature
+from helpers import synthetic_dataset
+
+SEEDS = list(range(4))
+
+
+def timestamped_dataset(rng, n_records):
+    dataset = synthetic_dataset(rng, n_records, ['0', '1', '2'])
+    start = 1.39e12
+    for i, record in enumerate(dataset[1:]):
+        record[5] = repr(start + i * rng.uniform(0, 3.6e6))
+    return dataset
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_lazy_decay_matches_eager_decay(seed):
+    rng = random.Random(seed)
+    # Tiny max_exponent so that renormalization happens many times
+    clock = DecayClock(half_life=50.0, max_exponent=2, prune_below=0.0)
+    counter = clock.counter()
+    eager = {}
+    now = 0.0
+    for _ in range(500):
+        t = now + rng.uniform(-20, 40)
+        token = rng.choice('abcde')
+        clock.advance(t)
+        if t > now:
+            eager = dict((k, v * 2 ** (-(t - now) / 50.0)) for k, v in eager.items())
+            now = t
+        eager[token] = eager.get(token, 0.0) + 2 ** (-(now - t) / 50.0)
+        counter[token] += 1
+    for token, value in eager.items():
+        assert counter[token] == pytest.approx(value, rel=1e-9)
+    assert counter.total() == pytest.approx(sum(eager.values()), rel=1e-9)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_streaming_update_matches_single_pass(seed):
+    rng = random.Random(seed)
+    dataset = timestamped_dataset(rng, 200)
+    records = dataset[1:]
+    for half_life in [None, 3.6e7]:
+        clock, streamed_clock = (DecayClock(half_life), DecayClock(half_life)) if half_life else (None, None)
+        single = TitleFeature(records, word_joins=[1, 2], decay_clock=clock)
+        streamed = TitleFeature(records[:70], word_joins=[1, 2], decay_clock=streamed_clock)
+        streamed.update(records[70:])
+        publisher = PublisherFeature(records, decay_clock=clock)
+        streamed_publisher = PublisherFeature(records[:70], decay_clock=streamed_clock)
+        streamed_publisher.update(records[70:])
+        for record in records[:30]:
+            for cat in ['0', '1', '2']:
+                assert streamed.condition_log_prob(record, cat) == pytest.approx(single.condition_log_prob(record, cat))
+                assert streamed_publisher.condition_log_prob(record, cat) == \
+                    pytest.approx(publisher.condition_log_prob(record, cat))
+
+
+def test_classifier_update_with_char_ngrams_matches_single_pass():
+    rng = random.Random(0)
+    dataset = timestamped_dataset(rng, 200)
+    records = dataset[1:]
+    single = NewsClassifier(smoothing_factor=0.5, char_ngram_sizes=[2, 3])
+    single.features['title'] = TitleFeature(records, smoothing_factor=0.5)
+    single.features['char_ngram'] = CharNgramFeature(records, ngram_sizes=[2, 3], num_buckets=512)
+    single.categories = Counter(record[6] for record in records)
+    streamed = NewsClassifier(smoothing_factor=0.5, char_ngram_sizes=[2, 3])
+    streamed.features['title'] = TitleFeature(records[:70], smoothing_factor=0.5)
+    streamed.features['char_ngram'] = CharNgramFeature(records[:70], ngram_sizes=[2, 3], num_buckets=512)
+    streamed.categories = Counter(record[6] for record in records[:70])
+    # Builds the lazy bucket dicts, which the update must invalidate
+    streamed.explain(records[0])
+    streamed.update(records[70:])
+    for record in records[:30]:
+        assert streamed.log_posterior(record) == pytest.approx(single.log_posterior(record))
+        assert streamed.explain(record)['log_posterior'] == pytest.approx(single.explain(record)['log_posterior'])
+
+
+def test_category_with_known_vocabulary_survives_renormalization():
+    records = []
+    for day in range(600):
+        timestamp = repr(1.39e12 + day * DAY)
+        records.append([str(2 * day), 'foo bar', '', 'Publisher 0', 'www.0.com', timestamp, 'x'])
+        records.append([str(2 * day + 1), 'word{}'.format(day), '', 'Publisher 0', 'www.0.com', timestamp, 'y'])
+    classifier = NewsClassifier(half_life_days=7)
+    classifier.decay_clock = DecayClock(7 * DAY)
+    classifier.features['title'] = TitleFeature(records[:10], decay_clock=classifier.decay_clock)
+    classifier.categories = classifier.decay_clock.counter(prune=False)
+    classifier._update_categories(records[:10])
+    # Streams far past max_exponent half-lives, 'x' never adds a word after the first day
+    classifier.update(records[10:])
+    assert classifier.decay_clock.reference > float(records[10][5])
+    assert sorted(classifier.features['title'].category_count) == ['x', 'y']
+    assert sorted(classifier.log_posterior(records[-1])) == ['x', 'y']
+    assert classifier.predict(records[-2]) == 'x'
+
+
+def test_half_life_rejects_char_ngrams():
+    with pytest.raises(ValueError):
+        NewsClassifier(char_ngram_sizes=[3], half_life_days=7)
+
+
+def test_long_half_life_matches_exact_counts():
+    rng = random.Random(0)
+    dataset = timestamped_dataset(rng, 300)
+    exact = NewsClassifier()
+    exact.features['title'] = TitleFeature(dataset[1:])
+    exact.categories = Counter(record[6] for record in dataset[1:])
+    decayed = NewsClassifier()
+    decayed.decay_clock = DecayClock(half_life=1e30)
+    decayed.features['title'] = TitleFeature(dataset[1:], decay_clock=decayed.decay_clock)
+    decayed.categories = decayed.decay_clock.counter()
+    decayed._update_categories(dataset[1:])
+    assert decayed.predict_dataset(dataset) == exact.predict_dataset(dataset)
+
+
+def test_recent_records_outweigh_old_ones():
+    clock = DecayClock(half_life=10.0)
+    counter = clock.counter()
+    clock.advance(0)
+    counter['old'] += 4
+    clock.advance(30)
+    counter['new'] += 1
+    assert counter['old'] == pytest.approx(0.5)
+    assert counter['new'] > counter['old']
@@ -0,0 +1,108 @@
+"""
+Every alternate scoring path must keep giving the predictions and log posteriors of NewsClassifier.predict,
+frozen in golden/test_v2_reference.csv (see make_golden.py).
+"""
+import numpy as np
+import pytest
+
+from helpers import reference_classifier
+from ensemble import EnsembleClassifier
+
+
+def golden_log_posteriors(golden, categories):
+    golden_categories, rows = golden
+    columns = [golden_categories.index(cat) for cat in categories]
+    return np.array([[row[2][i] for i in columns] for row in rows])
+
+
+def test_reference_predict_matches_golden(classifier, test_dataset, golden):
+    _, rows = golden
+    assert [r[0] for r in rows] == [record[0] for record in test_dataset[1:]]
+    assert [classifier.predict(record) for record in test_dataset[1:]] == [r[1] for r in rows]
+
+
+def test_reference_log_posterior_matches_golden(classifier, test_dataset, golden):
+    categories = list(classifier.categories)
+    log_posteriors = np.array([[lp[cat] for cat in categories]
+                               for lp in map(classifier.log_posterior, test_dataset[1:])])
+    np.testing.assert_allclose(log_posteriors, golden_log_posteriors(golden, categories), rtol=0, atol=1e-9)
+
+
+def test_predict_dataset_matches_golden(classifier, test_dataset, golden):
+    _, rows = golden
+    assert classifier.predict_dataset(test_dataset) == [[r[0], r[1]] for r in rows]
+
+
+@pytest.mark.parametrize('dtype, atol, min_agreement', [('float32', 1e-3, 1.0), ('int16', 5e-2, 0.999)])
+def test_quantized_matches_golden(classifier, test_dataset, golden, dtype, atol, min_agreement):
+    model = classifier.quantize(dtype)
+    np.testing.assert_allclose(model.log_posteriors(test_dataset[1:]),
+                               golden_log_posteriors(golden, model.categories), rtol=0, atol=atol)
+    _, rows = golden
+    preds = model.predict_dataset(test_dataset)
+    agreement = np.mean([p[1] == r[1] for p, r in zip(preds, rows)])
+    assert agreement >= min_agreement
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'int16'])
+def test_quantized_disagreement_matches_golden(classifier, test_dataset, golden, dtype):
+    model = classifier.quantize(dtype)
+    _, rows = golden
+    report = model.disagreement(classifier, test_dataset)
+    expected_ids = [r[0] for p, r in zip(model.predict_dataset(test_dataset), rows) if p[1] != r[1]]
+    assert report['total'] == len(rows)
+    assert report['article_ids'] == expected_ids
+    assert report['disagreements'] == len(expected_ids)
+    assert report['rate'] == pytest.approx(len(expected_ids) * 1.0 / len(rows))
+    if dtype == 'float32':
+        assert report['disagreements'] == 0
+
+
+def test_store_backed_matches_golden(tmp_path, test_dataset, golden):
+    # Tiny hot token cache so that most lookups go through sqlite
+    classifier = reference_classifier(store_path=str(tmp_path / 'vocabulary.db'), store_cache_size=16)
+    categories = list(classifier.categories)
+    log_posteriors = np.array([[lp[cat] for cat in categories]
+                               for lp in map(classifier.log_posterior, test_dataset[1:])])
+    np.testing.assert_allclose(log_posteriors, golden_log_posteriors(golden, categories), rtol=0, atol=1e-9)
+    _, rows = golden
+    assert classifier.predict_dataset(test_dataset) == [[r[0], r[1]] for r in rows]
+
+
+def test_ensemble_primary_matches_golden(classifier, test_dataset, golden):
+    shadow = reference_classifier(word_joins=[1, 2])
+    ensemble = EnsembleClassifier([classifier, shadow], weights=[1.0, 0.0])
+    _, rows = golden
+    pred_result = ensemble.predict_dataset(test_dataset)
+    assert [p[1] for p in pred_result] == [r[1] for r in rows]
+    # A zero weighted shadow leaves the combined prediction equal to the primary one
+    assert [p[3] for p in pred_result] == [r[1] for r in rows]
+    assert [p[2] for p in pred_result] == [p[1] for p in shadow.predict_dataset(test_dataset)]
+
+
+def test_explain_matches_golden(classifier, test_dataset, golden):
+    _, rows = golden
+    categories = list(classifier.categories)
+    explanations = [classifier.explain(record) for record in test_dataset[1:]]
+    assert [e['category'] for e in explanations] == [r[1] for r in rows]
+    log_posteriors = np.array([[e['log_posterior'][cat] for cat in categories] for e in explanations])
+    np.testing.assert_allclose(log_posteriors, golden_log_posteriors(golden, categories), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('suffix', ['', '.gz', '.bz2'])
+def test_sharded_compressed_input_matches_golden(tmp_path, classifier, test_dataset, golden, suffix):
+    header, records = test_dataset[0], test_dataset[1:]
+    for i in range(0, len(records), 1000):
+        classifier.write_csv(str(tmp_path / 'shard_{:03d}.csv{}'.format(i // 1000, suffix)), [header] + records[i:i + 1000])
+    _, rows = golden
+    expected = [[r[0], r[1]] for r in rows]
+    assert classifier.read_csv(str(tmp_path)) == test_dataset
+    assert classifier.predict_dataset(file_path=str(tmp_path)) == expected
+    assert classifier.predict_dataset(file_path=str(tmp_path / ('shard_*.csv' + suffix))) == expected
+
+
+def test_headerless_continuation_shards_keep_every_row(tmp_path, classifier, test_dataset):
+    header, records = test_dataset[0], test_dataset[1:21]
+    classifier.write_csv(str(tmp_path / 'shard_000.csv'), [header] + records[:10])
+    classifier.write_csv(str(tmp_path / 'shard_001.csv.gz'), records[10:])
+    assert classifier.read_csv(str(tmp_path)) == [header] + records
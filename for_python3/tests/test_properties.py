@@ -0,0 +1,195 @@
+"""
+Randomized checks of the alternate scoring paths against NewsClassifier.predict on synthetic corpora.
+"""
+import gc
+import random
+import weakref
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from classifier import NewsClassifier
+from helpers import HEADER, synthetic_dataset
+from ensemble import EnsembleClassifier
+from evaluation import evaluation_report, format_report
+from feature_bk2 import TitleFeature, PublisherFeature, HostnameFeature, CharNgramFeature
+from store import SQLiteVocabularyStore
+
+SEEDS = list(range(8))
+
+
+def synthetic_classifier(training_data, smoothing_factor=0.5, word_joins=None, store=None, char_ngrams=False):
+    classifier = NewsClassifier(smoothing_factor=smoothing_factor, word_joins=word_joins)
+    classifier.features['title'] = TitleFeature(training_data[1:], smoothing_factor=smoothing_factor,
+                                                word_joins=word_joins, store=store)
+    classifier.features['publisher'] = PublisherFeature(training_data[1:], smoothing_factor=1.0)
+    classifier.features['hostname'] = HostnameFeature(training_data[1:], smoothing_factor=1.0)
+    if char_ngrams:
+        classifier.features['char_ngram'] = CharNgramFeature(training_data[1:], smoothing_factor=1.0,
+                                                             ngram_sizes=[2, 3], num_buckets=512)
+    classifier.categories = Counter(record[6] for record in training_data[1:])
+    return classifier
+
+
+@pytest.fixture(params=SEEDS)
+def corpus(request):
+    rng = random.Random(request.param)
+    categories = [str(c) for c in range(rng.randint(2, 6))]
+    training_data = synthetic_dataset(rng, rng.randint(50, 300), categories)
+    # Make sure every category is seen in training
+    training_data += [[str(-i), 'w0', '', 'Publisher 0', 'www.0.com', '', cat] for i, cat in enumerate(categories)]
+    test_dataset = [HEADER[:6]] + [record[:6] for record in synthetic_dataset(rng, 100, categories)[1:]]
+    word_joins = rng.choice([None, [1, 2], [2], [1, 2, 3]])
+    return training_data, test_dataset, word_joins
+
+
+def log_posterior_matrix(classifier, test_dataset):
+    categories = list(classifier.categories)
+    return np.array([[lp[cat] for cat in categories] for lp in map(classifier.log_posterior, test_dataset[1:])])
+
+
+def test_tokens_log_prob_matches_condition_log_prob(corpus):
+    training_data, test_dataset, word_joins = corpus
+    classifier = synthetic_classifier(training_data, word_joins=word_joins, char_ngrams=True)
+    for feature in classifier.features.values():
+        for record in test_dataset[1:]:
+            tokens = feature.feature_tokens(record)
+            assert feature.tokenizer()(record) == tokens
+            for cat in classifier.categories:
+                expected = feature.condition_log_prob(record, cat)
+                assert feature.tokens_log_prob(tokens, cat) == pytest.approx(expected, abs=1e-9)
+                assert feature.token_log_probs(tokens, [cat]).sum() == pytest.approx(expected, abs=1e-9)
+
+
+@pytest.mark.parametrize('dtype, atol', [('float32', 1e-3), ('int16', 5e-2)])
+def test_quantized_log_posteriors_match(corpus, dtype, atol):
+    training_data, test_dataset, word_joins = corpus
+    classifier = synthetic_classifier(training_data, word_joins=word_joins, char_ngrams=True)
+    model = classifier.quantize(dtype)
+    expected = log_posterior_matrix(classifier, test_dataset)
+    # The exported model keeps none of the feature counts
+    features = [weakref.ref(feature) for feature in classifier.features.values()]
+    del classifier
+    gc.collect()
+    assert all(feature() is None for feature in features)
+    np.testing.assert_allclose(model.log_posteriors(test_dataset[1:]), expected, rtol=0, atol=atol)
+
+
+def test_quantized_float32_predictions_match(corpus):
+    training_data, test_dataset, word_joins = corpus
+    classifier = synthetic_classifier(training_data, word_joins=word_joins)
+    exact = log_posterior_matrix(classifier, test_dataset)
+    ordered = np.sort(exact, axis=1)
+    # Records whose two best categories are within float32 rounding may legitimately flip
+    clear = (ordered[:, -1] - ordered[:, -2]) > 1e-3
+    preds = classifier.quantize('float32').predict_dataset(test_dataset)
+    expected = classifier.predict_dataset(test_dataset)
+    assert [p for p, c in zip(preds, clear) if c] == [e for e, c in zip(expected, clear) if c]
+
+
+def test_store_backed_matches_in_memory(corpus):
+    training_data, test_dataset, word_joins = corpus
+    classifier = synthetic_classifier(training_data, word_joins=word_joins)
+    store = SQLiteVocabularyStore(':memory:', cache_size=8)
+    stored = synthetic_classifier(training_data, word_joins=word_joins, store=store)
+    title, stored_title = classifier.features['title'], stored.features['title']
+    for cat in classifier.categories:
+        assert dict(stored_title.category_counts(cat).items()) == title.category_counts(cat)
+        assert stored_title.category_total(cat) == title.category_total(cat)
+    np.testing.assert_allclose(log_posterior_matrix(stored, test_dataset), log_posterior_matrix(classifier, test_dataset),
+                               rtol=0, atol=1e-9)
+    assert stored.predict_dataset(test_dataset) == classifier.predict_dataset(test_dataset)
+
+
+def test_reopened_store_matches_in_memory(corpus, tmp_path):
+    training_data, test_dataset, word_joins = corpus
+    title = TitleFeature(training_data[1:], smoothing_factor=0.5, word_joins=word_joins)
+    path = str(tmp_path / 'vocabulary.db')
+    store = SQLiteVocabularyStore(path)
+    TitleFeature(training_data[1:], smoothing_factor=0.5, word_joins=word_joins, store=store)
+    store.close()
+    reopened = TitleFeature.from_store(SQLiteVocabularyStore(path, cache_size=8), smoothing_factor=0.5,
+                                       word_joins=word_joins)
+    assert sorted(reopened.category_count) == sorted(title.category_count)
+    for record in test_dataset[1:]:
+        for cat in title.category_count:
+            assert reopened.condition_log_prob(record, cat) == pytest.approx(title.condition_log_prob(record, cat),
+                                                                             abs=1e-9)
+
+
+def test_ensemble_matches_individual_models(corpus):
+    training_data, test_dataset, word_joins = corpus
+    primary = synthetic_classifier(training_data)
+    shadow = synthetic_classifier(training_data, smoothing_factor=0.1, word_joins=word_joins, char_ngrams=True)
+    ensemble = EnsembleClassifier([primary, shadow])
+    pred_result = ensemble.predict_dataset(test_dataset)
+    assert [p[:2] for p in pred_result] == primary.predict_dataset(test_dataset)
+    assert [[p[0], p[2]] for p in pred_result] == shadow.predict_dataset(test_dataset)
+
+
+def test_ensemble_disagreement_summary_matches_diff(corpus):
+    training_data, test_dataset, word_joins = corpus
+    primary = synthetic_classifier(training_data)
+    shadows = [synthetic_classifier(training_data, smoothing_factor=0.1, word_joins=word_joins, char_ngrams=True),
+               synthetic_classifier(training_data, smoothing_factor=5.0, word_joins=[2])]
+    assert EnsembleClassifier([primary] + shadows).columns == ['article_id', 'category', 'shadow_1', 'shadow_2']
+    ensemble = EnsembleClassifier([primary] + shadows, weights=[0.5, 0.3, 0.2])
+    assert ensemble.columns == ['article_id', 'category', 'shadow_1', 'shadow_2', 'combined']
+    pred_result = ensemble.predict_dataset(test_dataset)
+    assert all(len(row) == len(ensemble.columns) for row in pred_result)
+    primary_preds = [p[1] for p in primary.predict_dataset(test_dataset)]
+    summary = ensemble.disagreement_summary(pred_result)
+    assert sorted(summary) == ['combined', 'shadow_1', 'shadow_2']
+    for name, shadow in zip(['shadow_1', 'shadow_2'], shadows):
+        shadow_preds = [p[1] for p in shadow.predict_dataset(test_dataset)]
+        diff = [(p, q) for p, q in zip(primary_preds, shadow_preds) if p != q]
+        assert summary[name]['disagreements'] == len(diff)
+        assert summary[name]['rate'] == pytest.approx(len(diff) * 1.0 / len(primary_preds))
+        assert summary[name]['pairs'] == Counter(diff)
+    categories = list(primary.categories)
+    weighted = np.zeros((len(test_dataset) - 1, len(categories)))
+    for weight, classifier in zip(ensemble.weights, [primary] + shadows):
+        weighted += weight * log_posterior_matrix(classifier, test_dataset)
+    combined_preds = [categories[i] for i in np.argmax(weighted, axis=1)]
+    assert [row[4] for row in pred_result] == combined_preds
+    combined = [(p, q) for p, q in zip(primary_preds, combined_preds) if p != q]
+    assert summary['combined']['disagreements'] == len(combined)
+    assert summary['combined']['pairs'] == Counter(combined)
+
+
+def test_explain_matches_predict(corpus):
+    training_data, test_dataset, word_joins = corpus
+    classifier = synthetic_classifier(training_data, word_joins=word_joins, char_ngrams=True)
+    for record in test_dataset[1:]:
+        explanation = classifier.explain(record, top_n=3)
+        log_posterior = classifier.log_posterior(record)
+        assert explanation['category'] == classifier.predict(record)
+        for cat in classifier.categories:
+            assert explanation['log_posterior'][cat] == pytest.approx(log_posterior[cat], abs=1e-9)
+            for feature in explanation['features'].values():
+                assert len(feature[cat]['top_tokens']) <= 3
+            for token, _, _ in explanation['features']['char_ngram'][cat]['top_tokens']:
+                assert token in '^' + record[1].lower() + '$'
+
+
+def test_evaluation_report_matches_counts(corpus):
+    training_data, _, word_joins = corpus
+    classifier = synthetic_classifier(training_data, word_joins=word_joins)
+    report = classifier.evaluate(training_data)
+    labels = [record[6] for record in training_data[1:]]
+    preds = [p[1] for p in classifier.predict_dataset(training_data)]
+    assert report['accuracy'] == pytest.approx(np.mean([l == p for l, p in zip(labels, preds)]))
+    assert report['confusion'].sum() == len(labels)
+    assert report['support'].tolist() == [labels.count(cat) for cat in report['categories']]
+    other = evaluation_report(labels, preds, categories=report['categories'])
+    np.testing.assert_array_equal(other['confusion'], report['confusion'])
+    lines = format_report(report).splitlines()
+    assert lines[0] == 'accuracy={:.4f} over {} records'.format(report['accuracy'], len(labels))
+    k = len(report['categories'])
+    # Header, one precision/recall/f1 row and one confusion row per category
+    assert len(lines) == 3 + 2 * k
+    for i, cat in enumerate(report['categories']):
+        assert lines[2 + i].split() == [cat] + ['{:.4f}'.format(report[m][i]) for m in ('precision', 'recall', 'f1')] + \
+            [str(report['support'][i])]
+        assert [int(c) for c in lines[3 + k + i].split()[1:]] == report['confusion'][i].tolist()
@@ -0,0 +1,73 @@
+import random
+from collections import Counter
+
+import pytest
+
+from sketch import CountMinSketch, ApproximateCounter
+from classifier import NewsClassifier
+from feature_bk2 import PublisherFeature
+
+SEEDS = list(range(4))
+
+
+def skewed_tokens(rng, n):
+    return ['t{}'.format(int(rng.paretovariate(1.2))) for _ in range(n)]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_count_min_sketch_never_undercounts(seed):
+    rng = random.Random(seed)
+    tokens = skewed_tokens(rng, 5000)
+    sketch = CountMinSketch(width=256, depth=4)
+    for token in tokens:
+        sketch.add(token)
+    assert all(sketch.query(token) >= count for token, count in Counter(tokens).items())
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_approximate_counter_keeps_heavy_hitters(seed):
+    rng = random.Random(seed)
+    tokens = skewed_tokens(rng, 20000)
+    counter = ApproximateCounter(capacity=50, width=1024)
+    for token in tokens:
+        # Same update pattern as the Feature training loops
+        if token not in counter:
+            counter[token] = 0
+        counter[token] += 1
+    exact = Counter(tokens)
+    assert counter.total() == len(tokens)
+    assert len(counter.heavy) == 50
+    for token, count in exact.most_common(10):
+        assert counter.get(token) == count
+    assert all(counter.get(token) >= count for token, count in exact.items())
+    assert len(counter) == pytest.approx(len(exact), rel=0.1)
+
+
+def test_approximate_counter_only_increments():
+    counter = ApproximateCounter(capacity=2)
+    counter['a'] += 3
+    assert counter['a'] == 3
+    assert counter.get('missing') is None
+    with pytest.raises(ValueError):
+        counter['a'] = 1
+
+
+def test_approximate_publisher_matches_exact_when_within_capacity():
+    rng = random.Random(0)
+    training_data = [[str(i), '', '', 'publisher {}'.format(rng.randint(0, 20)), '', '', str(rng.randint(0, 2))]
+                     for i in range(500)]
+    exact = PublisherFeature(training_data)
+    approximate = PublisherFeature(training_data, bag_factory=lambda: ApproximateCounter(capacity=64))
+    for record in training_data[:50]:
+        for cat in ['0', '1', '2']:
+            assert approximate.condition_log_prob(record, cat) == pytest.approx(exact.condition_log_prob(record, cat))
+
+
+def test_quantize_rejects_approximate_counts():
+    training_data = [[str(i), 'title {}'.format(i), '', 'publisher {}'.format(i % 5), '', '', str(i % 2)]
+                     for i in range(100)]
+    classifier = NewsClassifier()
+    classifier.features['publisher'] = PublisherFeature(training_data, bag_factory=lambda: ApproximateCounter(capacity=2))
+    classifier.categories = Counter(record[6] for record in training_data)
+    with pytest.raises(ValueError):
+        classifier.quantize()